@@ -0,0 +1,25 @@
+"""Indexes for user post and like feeds.
+
+Revision ID: 3c9d7e15b2a8
+Revises: 8e4f2a61c0b7
+Create Date: 2026-10-18 16:05:51.927310
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9d7e15b2a8'
+down_revision = '8e4f2a61c0b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_post_author_id_id', 'post', ['author_id', 'id'])
+    op.create_index('ix_user_like_post_post_id', 'user_like_post', ['post_id'])
+
+
+def downgrade():
+    op.drop_index('ix_user_like_post_post_id', 'user_like_post')
+    op.drop_index('ix_post_author_id_id', 'post')
@@ -0,0 +1,29 @@
+"""Denormalized post like count.
+
+Revision ID: 5b1e0c7a9f3d
+Revises: d2ded671a06a
+Create Date: 2026-10-18 10:12:40.118425
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1e0c7a9f3d'
+down_revision = 'd2ded671a06a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('post', sa.Column('like_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        'UPDATE post SET like_count = likes.count '
+        'FROM (SELECT post_id, count(*) AS count FROM user_like_post GROUP BY post_id) AS likes '
+        'WHERE post.id = likes.post_id'
+    )
+
+
+def downgrade():
+    op.drop_column('post', 'like_count')
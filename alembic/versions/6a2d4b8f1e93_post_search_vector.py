@@ -0,0 +1,35 @@
+"""Full-text search vector of posts.
+
+Revision ID: 6a2d4b8f1e93
+Revises: 3c9d7e15b2a8
+Create Date: 2026-10-18 17:20:14.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+
+# revision identifiers, used by Alembic.
+revision = '6a2d4b8f1e93'
+down_revision = '3c9d7e15b2a8'
+branch_labels = None
+depends_on = None
+
+SEARCH_VECTOR_EXPRESSION = (
+    "setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', body), 'B')"
+)
+
+
+def upgrade():
+    # Adding a stored generated column rewrites the table, which takes a while on large ones.
+    op.add_column(
+        'post',
+        sa.Column('search_vector', TSVECTOR, sa.Computed(SEARCH_VECTOR_EXPRESSION), nullable=False),
+    )
+    op.create_index('ix_post_search_vector', 'post', ['search_vector'], postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_post_search_vector', 'post')
+    op.drop_column('post', 'search_vector')
@@ -0,0 +1,39 @@
+"""Daily post like rollup.
+
+Revision ID: 8e4f2a61c0b7
+Revises: 5b1e0c7a9f3d
+Create Date: 2026-10-18 13:47:05.502391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4f2a61c0b7'
+down_revision = '5b1e0c7a9f3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_user_like_post_datetime', 'user_like_post', ['datetime'])
+    op.create_table(
+        'post_like_daily',
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('post_id', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['post_id'], ['post.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('date', 'post_id')
+    )
+    op.execute(
+        'INSERT INTO post_like_daily (date, post_id, count) '
+        'SELECT CAST(datetime AS DATE), post_id, count(*) FROM user_like_post '
+        'WHERE datetime < current_date '
+        'GROUP BY CAST(datetime AS DATE), post_id'
+    )
+
+
+def downgrade():
+    op.drop_table('post_like_daily')
+    op.drop_index('ix_user_like_post_datetime', 'user_like_post')
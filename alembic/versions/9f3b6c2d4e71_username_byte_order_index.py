@@ -0,0 +1,24 @@
+"""Username index in byte order for prefix search.
+
+Revision ID: 9f3b6c2d4e71
+Revises: 6a2d4b8f1e93
+Create Date: 2026-10-18 19:05:42.873120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f3b6c2d4e71'
+down_revision = '6a2d4b8f1e93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_app_user_username_c', 'app_user', [sa.text('(username COLLATE "C")')])
+
+
+def downgrade():
+    op.drop_index('ix_app_user_username_c', 'app_user')
@@ -0,0 +1,270 @@
+import asyncio
+import json
+import random
+import time
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+import httpx
+
+from src.bot_stats import RunStats, get_outcome
+from src.random_words import WordGenerator
+
+BASE_URL = 'http://localhost:8000'
+
+
+class RateLimiter:
+    """ Spaces requests out to reach requests_per_second, raising the rate linearly during ramp_up_seconds. """
+
+    MIN_REQUESTS_PER_SECOND = 1
+
+    def __init__(self, requests_per_second: Optional[float], ramp_up_seconds: float = 0):
+        self._requests_per_second = requests_per_second
+        self._ramp_up_seconds = ramp_up_seconds
+        self._lock = asyncio.Lock()
+        self._started_at: Optional[float] = None
+        self._next_request_at: Optional[float] = None
+
+    def _current_rate(self, now: float) -> float:
+        if not self._ramp_up_seconds:
+            return self._requests_per_second
+        ramp_up_progress = min(1.0, (now - self._started_at) / self._ramp_up_seconds)
+        return max(self.MIN_REQUESTS_PER_SECOND, self._requests_per_second * ramp_up_progress)
+
+    async def wait(self) -> None:
+        if not self._requests_per_second:
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            if self._started_at is None:
+                self._started_at = self._next_request_at = now
+            delay = self._next_request_at - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_request_at = max(self._next_request_at, now) + 1 / self._current_rate(now)
+
+
+class AsyncBot:
+    """
+    Load generating version of Bot.
+
+    Runs the same actions, but up to `concurrency` requests at a time over a pool of keep-alive connections,
+    optionally capped at `requests_per_second` which is reached after `ramp_up_seconds`.
+    If `scenario` weights are given, the likes are followed by `scenario_requests` actions picked at random
+    with these weights, e.g. {"list_posts": 80, "get_post": 15, "like": 5} for a read-heavy load.
+    """
+    _words: WordGenerator
+    _number_of_users: int
+    _max_posts_per_user: int
+    _max_likes_per_user: int
+    _concurrency: int
+    _requests_per_second: Optional[float]
+    _ramp_up_seconds: float
+    _scenario: Optional[dict[str, float]]
+    _scenario_requests: int
+    _report_json_path: Optional[str]
+    _report_csv_path: Optional[str]
+    MIN_WORDS_IN_POST = 2
+    MAX_WORDS_IN_POST = 12
+    ANALYTICS_DAYS = 30
+
+    def __init__(
+            self,
+            *,
+            number_of_users: Optional[int] = None,
+            max_posts_per_user: Optional[int] = None,
+            max_likes_per_user: Optional[int] = None,
+            seed: Optional[int] = None,
+            concurrency: int = 10,
+            requests_per_second: Optional[float] = None,
+            ramp_up_seconds: float = 0,
+            scenario: Optional[dict[str, float]] = None,
+            scenario_requests: int = 0,
+            report_json_path: Optional[str] = None,
+            report_csv_path: Optional[str] = None,
+    ):
+        self._number_of_users = number_of_users
+        self._max_posts_per_user = max_posts_per_user
+        self._max_likes_per_user = max_likes_per_user
+        self._concurrency = concurrency
+        self._requests_per_second = requests_per_second
+        self._ramp_up_seconds = ramp_up_seconds
+        self._scenario = scenario
+        self._scenario_requests = scenario_requests
+        self._report_json_path = report_json_path
+        self._report_csv_path = report_csv_path
+        self._words = WordGenerator(seed)
+        self.stats = RunStats()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._rate_limiter: Optional[RateLimiter] = None
+
+    def read_config_from_file(self, file_path):
+        """ Loads config from file, overwriting current values. """
+        with open(file_path) as json_file:
+            data = json.load(json_file)
+        self._number_of_users = data.get('number_of_users')
+        self._max_posts_per_user = data.get('max_posts_per_user')
+        self._max_likes_per_user = data.get('max_likes_per_user')
+        self._words = WordGenerator(data.get('seed'))
+        self._concurrency = data.get('concurrency', self._concurrency)
+        self._requests_per_second = data.get('requests_per_second', self._requests_per_second)
+        self._ramp_up_seconds = data.get('ramp_up_seconds', self._ramp_up_seconds)
+        self._scenario = data.get('scenario', self._scenario)
+        self._scenario_requests = data.get('scenario_requests', self._scenario_requests)
+        self._report_json_path = data.get('report_json_path', self._report_json_path)
+        self._report_csv_path = data.get('report_csv_path', self._report_csv_path)
+
+    async def _request(self, action: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        """
+        Sends request once the rate limiter allows it, recording its latency and outcome under action.
+        Returns None on connection errors.
+        """
+        await self._rate_limiter.wait()
+        started_at = time.perf_counter()
+        try:
+            response = await self._client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.stats.record(action, time.perf_counter() - started_at, type(e).__name__)
+            return None
+        self.stats.record(action, time.perf_counter() - started_at, get_outcome(response.status_code))
+        return response
+
+    async def _for_each(self, items: Iterable, action: Callable[[Any], Awaitable[Any]]) -> list:
+        """ Calls action for every item, with at most `concurrency` calls in flight. Returns non-None results. """
+        item_iterator = iter(items)
+        results = []
+
+        async def worker():
+            for item in item_iterator:
+                result = await action(item)
+                if result is not None:
+                    results.append(result)
+
+        await asyncio.gather(*(worker() for _ in range(self._concurrency)))
+        return results
+
+    async def create_user(self) -> Optional[tuple[str, str]]:
+        username, password = self._words.unique_word(), next(self._words)
+        body = {'username': username, 'password': password}
+        response = await self._request('signup', 'POST', '/api/users/', json=body)
+        if response is not None and response.status_code == 200:
+            return username, password
+
+    async def create_users(self) -> list[tuple[str, str]]:
+        """
+        Registers users.
+
+        Returns:
+            List of (username, password) tuples for successfully created users.
+        """
+        assert self._number_of_users
+        credentials = await self._for_each(range(self._number_of_users), lambda _: self.create_user())
+        print(f'Created {len(credentials)} of {self._number_of_users} users')
+        return credentials
+
+    async def log_in_user(self, username: str, password: str) -> Optional[dict[str, str]]:
+        """ Logs in user, returning auth headers or None if could not log in. """
+        form = {'username': username, 'password': password}
+        response = await self._request('token', 'POST', '/token/', data=form)
+        if response is None or response.status_code != 200:
+            return None
+        token = response.json()
+        return {'Authorization': f'{token["token_type"]} {token["access_token"]}'}
+
+    async def log_in_users(self, users_credentials: list[tuple[str, str]]) -> list[dict[str, str]]:
+        auth_headers_list = await self._for_each(
+            users_credentials, lambda credentials: self.log_in_user(*credentials),
+        )
+        print(f'Logged in {len(auth_headers_list)} of {len(users_credentials)} users')
+        return auth_headers_list
+
+    async def create_post(self, auth_headers) -> Optional[int]:
+        """ Creates post, returning post_id or None if could not create. """
+        title = self._words.unique_word()
+        number_of_words_in_body = random.randrange(self.MIN_WORDS_IN_POST, self.MAX_WORDS_IN_POST + 1)
+        body = ' '.join(next(self._words) for _ in range(number_of_words_in_body))
+        post = {'title': title, 'body': body}
+        response = await self._request('create_post', 'POST', '/api/posts/', headers=auth_headers, json=post)
+        if response is not None and response.status_code == 200:
+            return response.json()['id']
+
+    async def create_posts(self, auth_headers_list) -> list[int]:
+        assert self._max_posts_per_user
+        posts_to_create = [
+            user_auth_headers
+            for user_auth_headers in auth_headers_list
+            for _ in range(random.randrange(1, self._max_posts_per_user + 1))
+        ]
+        post_id_list = await self._for_each(posts_to_create, self.create_post)
+        print(f'Created {len(post_id_list)} of {len(posts_to_create)} posts')
+        return post_id_list
+
+    async def like_post(self, post_id: int, auth_headers) -> Optional[bool]:
+        response = await self._request('like', 'POST', f'/api/posts/{post_id}/like/', headers=auth_headers)
+        if response is not None and response.status_code == 200:
+            return True
+
+    async def like_posts(self, auth_headers_list, post_id_list):
+        assert self._max_likes_per_user
+        likes_to_create = []
+        for user_auth_headers in auth_headers_list:
+            number_of_likes = random.randrange(1, self._max_likes_per_user + 1)
+            number_of_likes = min(number_of_likes, len(post_id_list))
+            for post_id in random.sample(post_id_list, number_of_likes):
+                likes_to_create.append((post_id, user_auth_headers))
+        likes = await self._for_each(likes_to_create, lambda like: self.like_post(*like))
+        print(f'Liked {len(likes)} of {len(likes_to_create)} posts')
+
+    async def unlike_post(self, post_id: int, auth_headers) -> Optional[bool]:
+        response = await self._request('unlike', 'DELETE', f'/api/posts/{post_id}/like/', headers=auth_headers)
+        if response is not None and response.status_code == 200:
+            return True
+
+    async def list_posts(self) -> Optional[bool]:
+        response = await self._request('list_posts', 'GET', '/api/posts/')
+        if response is not None and response.status_code == 200:
+            return True
+
+    async def get_post(self, post_id: int) -> Optional[bool]:
+        response = await self._request('get_post', 'GET', f'/api/posts/{post_id}/')
+        if response is not None and response.status_code == 200:
+            return True
+
+    async def get_like_stats(self) -> Optional[bool]:
+        date_to = date.today()
+        params = {'date_from': date_to - timedelta(days=self.ANALYTICS_DAYS - 1), 'date_to': date_to}
+        response = await self._request('analytics', 'GET', '/api/analytics/post_likes/', params=params)
+        if response is not None and response.status_code == 200:
+            return True
+
+    async def run_scenario(self, auth_headers_list, post_id_list):
+        """ Runs scenario_requests actions picked according to scenario weights. """
+        scenario_actions = {
+            'list_posts': lambda: self.list_posts(),
+            'get_post': lambda: self.get_post(random.choice(post_id_list)),
+            'analytics': lambda: self.get_like_stats(),
+            'create_post': lambda: self.create_post(random.choice(auth_headers_list)),
+            'like': lambda: self.like_post(random.choice(post_id_list), random.choice(auth_headers_list)),
+            'unlike': lambda: self.unlike_post(random.choice(post_id_list), random.choice(auth_headers_list)),
+        }
+        unknown_actions = set(self._scenario) - set(scenario_actions)
+        assert not unknown_actions, f'Unknown scenario actions: {unknown_actions}'
+        assert auth_headers_list and post_id_list
+        actions = random.choices(
+            list(self._scenario), weights=list(self._scenario.values()), k=self._scenario_requests,
+        )
+        completed = await self._for_each(actions, lambda action: scenario_actions[action]())
+        print(f'Completed {len(completed)} of {len(actions)} scenario actions')
+
+    async def run_actions(self):
+        limits = httpx.Limits(max_connections=self._concurrency, max_keepalive_connections=self._concurrency)
+        self._rate_limiter = RateLimiter(self._requests_per_second, self._ramp_up_seconds)
+        async with httpx.AsyncClient(base_url=BASE_URL, limits=limits) as self._client:
+            user_credentials_list = await self.create_users()
+            auth_headers_list = await self.log_in_users(user_credentials_list)
+            post_id_list = await self.create_posts(auth_headers_list)
+            await self.like_posts(auth_headers_list, post_id_list)
+            if self._scenario:
+                await self.run_scenario(auth_headers_list, post_id_list)
+        self.stats.report(self._report_json_path, self._report_csv_path)
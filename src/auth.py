@@ -1,22 +1,31 @@
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 
 from fastapi import Depends, HTTPException, status, APIRouter
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import jwt, JWTError, ExpiredSignatureError
+from jose import JWTError, ExpiredSignatureError
 from passlib.context import CryptContext
 
-from db_operations import insert_user, fetch_user, update_last_visit, update_last_login
+from background import BoundedThreadPool, PoolSaturatedError
+from cache import TTLCache
+from db_operations import insert_user, fetch_user, fetch_user_cached, update_last_login
+from jwt_keys import jwt_keys
+from last_visit import last_visit_tracker
 from models import Token, UserAuth
+from monitoring import register_stats
+from settings import PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING, JWT_CACHE_SIZE, JWT_CACHE_TTL_SECONDS
 
 pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
-
-# Generate your own SECRET_KEY and keep it secret for use in production.
-# To get a string like this run:
-# openssl rand -hex 32
-SECRET_KEY = 'ecf998039f7d180e93bdcda768fc762b51132ebb71287e2dc8fb39230f4d5cfb'
-ALGORITHM = 'HS256'
+# bcrypt takes tens of milliseconds per call, so it runs off the event loop.
+password_hash_pool = BoundedThreadPool('password_hash', PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+register_stats('password_hash_pool', password_hash_pool.stats)
+
+# Verified tokens and their claims, so signatures are checked once per token rather than on every request.
+# Entries never outlive the token's exp.
+token_cache = TTLCache(maxsize=JWT_CACHE_SIZE, ttl=JWT_CACHE_TTL_SECONDS)
+register_stats('token_cache', token_cache.stats)
 ACCESS_TOKEN_EXPIRE_MINUTES = 300
 
 
@@ -31,16 +40,27 @@ def get_unauthorized_exception(detail: str):
 auth_router = APIRouter()
 
 
-def verify_password(password, password_hash):
-    return pwd_context.verify(password, password_hash)
+async def _run_in_password_hash_pool(func, *args):
+    try:
+        return await password_hash_pool.run(func, *args)
+    except PoolSaturatedError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Too many sign-ins in progress, try again later',
+            headers={'Retry-After': '1'},
+        )
+
 
+async def verify_password(password, password_hash):
+    return await _run_in_password_hash_pool(pwd_context.verify, password, password_hash)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+
+async def get_password_hash(password):
+    return await _run_in_password_hash_pool(pwd_context.hash, password)
 
 
 async def create_user(username: str, password: str) -> bool:
-    password_hash = get_password_hash(password)
+    password_hash = await get_password_hash(password)
     return await insert_user(username, password_hash)
 
 
@@ -48,7 +68,7 @@ async def authenticate_user(username: str, password: str) -> Optional[UserAuth]:
     user_auth: UserAuth = await fetch_user(username)
     if not user_auth:
         return None
-    if not verify_password(password, user_auth.password_hash):
+    if not await verify_password(password, user_auth.password_hash):
         return None
     return user_auth
 
@@ -60,13 +80,24 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({'exp': expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt_keys.encode(to_encode)
     return encoded_jwt
 
 
+def decode_access_token(token: str) -> dict:
+    """ Same as jwt_keys.decode, served from token_cache when possible. """
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = jwt_keys.decode(token)
+        expires_in = payload.get('exp', 0) - time.time()
+        if expires_in > 0:
+            token_cache.set(token, payload, ttl=min(expires_in, JWT_CACHE_TTL_SECONDS))
+    return payload
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserAuth:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
     except ExpiredSignatureError:
         raise get_unauthorized_exception('Token expired')
     except JWTError:
@@ -74,10 +105,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserAuth:
     username: str = payload.get('sub')
     if username is None:
         raise get_unauthorized_exception('Could not validate credentials')
-    user_auth: UserAuth = await fetch_user(username)
+    user_auth: UserAuth = await fetch_user_cached(username)
     if user_auth is None:
         raise get_unauthorized_exception('Could not validate credentials')
-    await update_last_visit(user_auth.id)
+    last_visit_tracker.record(user_auth.id)
     return user_auth
 
 
@@ -92,3 +123,8 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         data={'sub': user_auth.username}, expires_delta=access_token_expires
     )
     return {'access_token': access_token, 'token_type': 'bearer'}
+
+
+@auth_router.get('/.well-known/jwks.json')
+async def get_jwks():
+    return jwt_keys.jwks()
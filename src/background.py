@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+T = TypeVar('T')
+
+
+class PeriodicTask:
+    """ Calls an async callback every interval seconds in the background until stopped. """
+
+    def __init__(self, name: str, interval: float, callback: Callable[[], Awaitable[None]]):
+        self._name = name
+        self._interval = interval
+        self._callback = callback
+        self._stopping = False
+        # Created by start() rather than on import: before Python 3.10, asyncio primitives are bound
+        # to the event loop current when they are created, which isn't the one the server runs on.
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name=self._name)
+
+    def run_soon(self) -> None:
+        """ Calls the callback without waiting for the rest of the interval, or right after the current call. """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self) -> None:
+        """ Waits for a callback in progress to finish, so it's never interrupted halfway. """
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping:
+                return
+            try:
+                await self._callback()
+            except Exception:
+                logger.exception('Periodic task %s failed', self._name)
+
+
+class PoolSaturatedError(Exception):
+    pass
+
+
+class BoundedThreadPool:
+    """ Runs blocking functions on a thread pool, refusing new calls while max_pending of them are in flight. """
+
+    def __init__(self, name: str, workers: int, max_pending: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._workers = workers
+        self._max_pending = max_pending
+        self._pending = 0
+        self.rejected = 0
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        if self._pending >= self._max_pending:
+            self.rejected += 1
+            raise PoolSaturatedError
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'workers': self._workers,
+            'pending': self._pending,
+            'max_pending': self._max_pending,
+            'rejected': self.rejected,
+        }
@@ -0,0 +1,336 @@
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable
+
+import requests
+
+BASE_URL = 'http://localhost:8000'
+BENCHMARK_USERNAME = 'benchmark_user'
+BENCHMARK_PASSWORD = 'benchmark_password'
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+
+def print_latencies(name: str, latencies: list[float]) -> None:
+    latencies = sorted(latencies)
+    print(
+        f'{name}: {len(latencies)} requests, '
+        f'p50 {percentile(latencies, 0.5) * 1000:.1f} ms, '
+        f'p95 {percentile(latencies, 0.95) * 1000:.1f} ms, '
+        f'p99 {percentile(latencies, 0.99) * 1000:.1f} ms'
+    )
+
+
+def measure_latencies(request: Callable[[], requests.Response], duration: float) -> list[float]:
+    latencies = []
+    finish_at = time.perf_counter() + duration
+    while time.perf_counter() < finish_at:
+        started_at = time.perf_counter()
+        request().raise_for_status()
+        latencies.append(time.perf_counter() - started_at)
+    return latencies
+
+
+def ensure_benchmark_user() -> None:
+    body = {'username': BENCHMARK_USERNAME, 'password': BENCHMARK_PASSWORD}
+    response = requests.post(f'{BASE_URL}/api/users/', json=body)
+    if response.status_code not in (200, 409):
+        response.raise_for_status()
+
+
+def bench_login_load(args) -> None:
+    """ GET /api/posts/ latency on an idle server, then while args.logins clients keep signing in. """
+    ensure_benchmark_user()
+    session = requests.Session()
+    list_posts = lambda: session.get(f'{BASE_URL}/api/posts/')
+    print_latencies('GET /api/posts/ idle', measure_latencies(list_posts, args.duration))
+
+    stop = threading.Event()
+    login_statuses: list[int] = []
+
+    def log_in_repeatedly():
+        login_session = requests.Session()
+        credentials = {'username': BENCHMARK_USERNAME, 'password': BENCHMARK_PASSWORD}
+        while not stop.is_set():
+            login_statuses.append(login_session.post(f'{BASE_URL}/token/', data=credentials).status_code)
+
+    threads = [threading.Thread(target=log_in_repeatedly) for _ in range(args.logins)]
+    for thread in threads:
+        thread.start()
+    try:
+        latencies = measure_latencies(list_posts, args.duration)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    print_latencies(f'GET /api/posts/ during {args.logins} concurrent logins', latencies)
+    rejected = sum(1 for status_code in login_statuses if status_code == 503)
+    print(f'Logins: {len(login_statuses)} attempted, {rejected} rejected with 503')
+
+
+def bench_like_stats_formats(args) -> None:
+    """ Time and payload size of /api/analytics/post_likes/ in nested and columnar formats over args.days days. """
+    date_to = date.today()
+    date_from = date_to - timedelta(days=args.days - 1)
+    session = requests.Session()
+    for like_stats_format in ('nested', 'columnar'):
+        params = {'date_from': date_from, 'date_to': date_to, 'format': like_stats_format}
+        response_sizes = []
+
+        def get_like_stats():
+            response = session.get(f'{BASE_URL}/api/analytics/post_likes/', params=params)
+            response_sizes.append(len(response.content))
+            return response
+
+        latencies = measure_latencies(get_like_stats, args.duration)
+        print_latencies(f'{like_stats_format} over {args.days} days', latencies)
+        print(f'{like_stats_format} payload: {response_sizes[-1] / 1024:.1f} KiB')
+
+
+async def _measure_post_list_rps(limit: int, duration: float) -> None:
+    import httpx
+    import main
+    import settings
+    await main.startup()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url=BASE_URL) as client:
+            for fast_json in (False, True):
+                settings.FAST_JSON_RESPONSES = fast_json
+                requests_done = 0
+                finish_at = time.perf_counter() + duration
+                while time.perf_counter() < finish_at:
+                    response = await client.get('/api/posts/', params={'limit': limit})
+                    response.raise_for_status()
+                    requests_done += 1
+                mode = 'fast JSON' if fast_json else 'pydantic'
+                print(f'GET /api/posts/?limit={limit} {mode}: {requests_done / duration:.1f} requests/s')
+    finally:
+        await main.shutdown()
+
+
+def bench_post_list_json(args) -> None:
+    """
+    Requests/sec of GET /api/posts/ with args.limit posts, with pydantic models and with FAST_JSON_RESPONSES.
+
+    Unlike the other benchmarks it runs the app in this process, without network and with the response cache
+    disabled, so the difference comes from serialization alone. It needs the database, not a running server.
+    """
+    os.environ['RESPONSE_CACHE_TTL_SECONDS'] = '0'
+    asyncio.run(_measure_post_list_rps(args.limit, args.duration))
+
+
+def _time_per_call(func: Callable[[], object], duration: float) -> float:
+    calls = 0
+    finish_at = time.perf_counter() + duration
+    while time.perf_counter() < finish_at:
+        func()
+        calls += 1
+    return duration / calls
+
+
+def bench_token_decode(args) -> None:
+    """
+    Cost of verifying the access token of a request in get_current_user, with and without the token cache,
+    for a shared secret and for an RSA key. Runs in this process, without the server.
+    """
+    import tempfile
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    import auth
+    from cache import TTLCache
+    from jwt_keys import JWTKeys
+
+    with tempfile.TemporaryDirectory() as keys_dir:
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        Path(keys_dir, 'benchmark.pem').write_bytes(private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+        ))
+        key_sets = {
+            'HS256': JWTKeys('HS256', 'benchmark secret'),
+            'RS256': JWTKeys('RS256', '', keys_dir, 'benchmark'),
+        }
+
+    claims = {'sub': BENCHMARK_USERNAME, 'exp': datetime.utcnow() + timedelta(hours=1)}
+    for algorithm, keys in key_sets.items():
+        auth.jwt_keys = keys
+        auth.token_cache = TTLCache(maxsize=1, ttl=60)
+        token = keys.encode(claims)
+        uncached = _time_per_call(lambda: keys.decode(token), args.duration)
+        cached = _time_per_call(lambda: auth.decode_access_token(token), args.duration)
+        print(f'{algorithm}: {uncached * 1e6:.1f} us per request without cache, {cached * 1e6:.1f} us with cache')
+
+
+async def _measure_post_search(limit: int, queries: int) -> None:
+    from sqlalchemy import func, or_, select
+
+    import db_operations
+    from db_schema import database, post_table
+    await database.connect()
+    try:
+        post_count = await database.fetch_val(select([func.count()]).select_from(post_table))
+        # The first word of random titles, so each query has at least one match.
+        sample = await database.fetch_all(
+            select([post_table.c.title]).order_by(func.random()).limit(queries),
+        )
+        search_latencies, scan_latencies = [], []
+        for row in sample:
+            word = row['title'].split()[0]
+            started_at = time.perf_counter()
+            await db_operations.search_posts(word, limit=limit)
+            search_latencies.append(time.perf_counter() - started_at)
+
+            pattern = f'%{word}%'
+            scan_query = select([post_table.c.id]).where(
+                or_(post_table.c.title.ilike(pattern), post_table.c.body.ilike(pattern)),
+            ).limit(limit)
+            started_at = time.perf_counter()
+            await database.fetch_all(scan_query)
+            scan_latencies.append(time.perf_counter() - started_at)
+    finally:
+        await database.disconnect()
+    print_latencies(f'full-text search over {post_count} posts', search_latencies)
+    print_latencies(f'ILIKE scan over {post_count} posts', scan_latencies)
+
+
+def bench_post_search(args) -> None:
+    """
+    Latency of search_posts for words from random post titles, and of an ILIKE query finding the same posts.
+    Queries the database directly, without the server; seed a large dataset first to see the difference.
+    """
+    asyncio.run(_measure_post_search(args.limit, args.queries))
+
+
+def bench_import_time(args) -> None:
+    """
+    Time every server process spends importing the app on startup, and the imports of main.py it's spent on,
+    from python -X importtime in a fresh interpreter. Needs neither the server nor the database.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=Path(__file__).parent, capture_output=True, text=True, check=True,
+    )
+    # Lines are 'import time: <self us> | <cumulative us> | <module>', with modules indented by import depth.
+    # A module comes after the modules it imports, and the time of a module imported by several others
+    # goes to the first one.
+    imports = []
+    total_us = main_imports = None
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '[us]' in line:
+            continue
+        _, cumulative_us, module = line.split('|')
+        depth = (len(module) - len(module.lstrip()) - 1) // 2
+        if depth == 1:
+            imports.append((int(cumulative_us), module.strip()))
+        elif depth == 0:
+            if module.strip() == 'main':
+                total_us, main_imports = int(cumulative_us), imports
+            imports = []
+    if total_us is None:
+        sys.exit(f'main is missing from the python -X importtime output:\n{result.stderr}')
+    print(f'import main: {total_us / 1000:.1f} ms')
+    for cumulative_us, module in sorted(main_imports, reverse=True)[:10]:
+        print(f'  {module}: {cumulative_us / 1000:.1f} ms')
+
+
+async def _sample_like_pairs() -> tuple[list[int], list[int], set[tuple[int, int]]]:
+    """ Random user and post ids, and the pairs of them that are already liked. """
+    from db_schema import database
+    user_ids = [row[0] for row in await database.fetch_all('SELECT id FROM app_user ORDER BY random() LIMIT 1000')]
+    post_ids = [row[0] for row in await database.fetch_all('SELECT id FROM post ORDER BY random() LIMIT 1000')]
+    liked_query = (
+        'SELECT user_id, post_id FROM user_like_post WHERE user_id = ANY(:user_ids) AND post_id = ANY(:post_ids)'
+    )
+    rows = await database.fetch_all(liked_query, {'user_ids': user_ids, 'post_ids': post_ids})
+    return user_ids, post_ids, {(row[0], row[1]) for row in rows}
+
+
+async def _measure_like_ingestion(clients: int, duration: float) -> None:
+    import random
+    import db_operations
+    from db_schema import database
+    from like_buffer import LikeBuffer
+    from settings import LIKE_BUFFER_FLUSH_INTERVAL_MS, LIKE_BUFFER_FLUSH_SIZE, LIKE_BUFFER_MAX_SIZE
+
+    await database.connect()
+    try:
+        # databases keeps using the connection of a task for the tasks started from it, so queries made here
+        # would make all clients share one connection.
+        user_ids, post_ids, used_pairs = await asyncio.create_task(_sample_like_pairs())
+        # Likes made by the benchmark are removed in the end, so pairs that are already liked are never used.
+        new_pairs = []
+
+        def get_new_pair() -> tuple[int, int]:
+            while True:
+                pair = (random.choice(user_ids), random.choice(post_ids))
+                if pair not in used_pairs:
+                    used_pairs.add(pair)
+                    new_pairs.append(pair)
+                    return pair
+
+        async def like_repeatedly(like: Callable, finish_at: float) -> None:
+            while time.perf_counter() < finish_at:
+                await like(*get_new_pair())
+
+        for buffered in (False, True):
+            buffer = LikeBuffer(LIKE_BUFFER_FLUSH_INTERVAL_MS, LIKE_BUFFER_FLUSH_SIZE, LIKE_BUFFER_MAX_SIZE, 10_000)
+            like = buffer.like if buffered else db_operations.create_like
+            likes_before = len(new_pairs)
+            started_at = time.perf_counter()
+            buffer.start()
+            await asyncio.gather(*(like_repeatedly(like, started_at + duration) for _ in range(clients)))
+            # Includes writing the likes left in the buffer.
+            await buffer.stop()
+            likes_per_second = (len(new_pairs) - likes_before) / (time.perf_counter() - started_at)
+            mode = 'buffered' if buffered else 'one write per like'
+            print(f'{clients} clients, {mode}: {likes_per_second:.0f} likes/s')
+
+        cleanup = LikeBuffer(LIKE_BUFFER_FLUSH_INTERVAL_MS, LIKE_BUFFER_FLUSH_SIZE, len(new_pairs) + 1, 0)
+        for pair in new_pairs:
+            await cleanup.unlike(*pair)
+        await cleanup.flush()
+    finally:
+        await database.disconnect()
+
+
+def bench_like_ingestion(args) -> None:
+    """
+    Likes per second args.clients concurrent clients can make with a write per like and with the like buffer,
+    on random pairs of existing users and posts that aren't liked yet. Queries the database directly,
+    without the server, and removes the likes it made in the end.
+    """
+    asyncio.run(_measure_like_ingestion(args.clients, args.duration))
+
+
+BENCHMARKS = {
+    'login-load': bench_login_load,
+    'like-stats-formats': bench_like_stats_formats,
+    'post-list-json': bench_post_list_json,
+    'token-decode': bench_token_decode,
+    'post-search': bench_post_search,
+    'import-time': bench_import_time,
+    'like-ingestion': bench_like_ingestion,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks against a running server.')
+    parser.add_argument('benchmark', choices=BENCHMARKS)
+    parser.add_argument('--duration', type=float, default=10, help='seconds to measure each phase for')
+    parser.add_argument('--logins', type=int, default=16, help='concurrent login clients (login-load)')
+    parser.add_argument('--days', type=int, default=365, help='date range length (like-stats-formats)')
+    parser.add_argument('--limit', type=int, default=100, help='posts per page (post-list-json, post-search)')
+    parser.add_argument('--queries', type=int, default=20, help='search queries to run (post-search)')
+    parser.add_argument('--clients', type=int, default=32, help='concurrent clients (like-ingestion)')
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
@@ -1,22 +1,32 @@
+import asyncio
 import json
 import os
 import random
-from typing import Iterator, Optional
+import time
+from datetime import date, timedelta
+from typing import Optional
 
 import requests
 from oauthlib.oauth2 import LegacyApplicationClient
 from requests_oauthlib import OAuth2Session
 
-from src.random_words import RandomWordCycle
+from src.async_bot import AsyncBot
+from src.bot_stats import RunStats, get_outcome
+from src.random_words import WordGenerator
 
 
 class Bot:
-    _word_cycle: Iterator[str]
+    _words: WordGenerator
     _number_of_users: int
     _max_posts_per_user: int
     _max_likes_per_user: int
+    _scenario: Optional[dict[str, float]]
+    _scenario_requests: int
+    _report_json_path: Optional[str]
+    _report_csv_path: Optional[str]
     MIN_WORDS_IN_POST = 2
     MAX_WORDS_IN_POST = 12
+    ANALYTICS_DAYS = 30
 
     def __init__(
             self,
@@ -24,11 +34,21 @@ class Bot:
             number_of_users: Optional[int] = None,
             max_posts_per_user: Optional[int] = None,
             max_likes_per_user: Optional[int] = None,
+            seed: Optional[int] = None,
+            scenario: Optional[dict[str, float]] = None,
+            scenario_requests: int = 0,
+            report_json_path: Optional[str] = None,
+            report_csv_path: Optional[str] = None,
     ):
         self._number_of_users = number_of_users
         self._max_posts_per_user = max_posts_per_user
         self._max_likes_per_user = max_likes_per_user
-        self._word_cycle = RandomWordCycle()
+        self._scenario = scenario
+        self._scenario_requests = scenario_requests
+        self._report_json_path = report_json_path
+        self._report_csv_path = report_csv_path
+        self._words = WordGenerator(seed)
+        self.stats = RunStats()
 
     def read_config_from_file(self, file_path):
         """ Loads config from file, overwriting current values. """
@@ -37,6 +57,22 @@ class Bot:
         self._number_of_users = data.get('number_of_users')
         self._max_posts_per_user = data.get('max_posts_per_user')
         self._max_likes_per_user = data.get('max_likes_per_user')
+        self._words = WordGenerator(data.get('seed'))
+        self._scenario = data.get('scenario', self._scenario)
+        self._scenario_requests = data.get('scenario_requests', self._scenario_requests)
+        self._report_json_path = data.get('report_json_path')
+        self._report_csv_path = data.get('report_csv_path')
+
+    def _request(self, action: str, method: str, url: str, **kwargs) -> Optional[requests.Response]:
+        """ Sends request, recording its latency and outcome under action. Returns None on connection errors. """
+        started_at = time.perf_counter()
+        try:
+            response = requests.request(method, url, **kwargs)
+        except requests.RequestException:
+            self.stats.record(action, time.perf_counter() - started_at, 'connection_error')
+            return None
+        self.stats.record(action, time.perf_counter() - started_at, get_outcome(response.status_code))
+        return response
 
     def create_users(self) -> list[tuple[str, str]]:
         """
@@ -49,10 +85,10 @@ class Bot:
         url = 'http://localhost:8000/api/users/'
         credentials = []
         for _ in range(self._number_of_users):
-            username, password = next(self._word_cycle), next(self._word_cycle)
+            username, password = self._words.unique_word(), next(self._words)
             body = {'username': username, 'password': password}
-            response = requests.post(url, json=body)
-            if response.status_code == 200:
+            response = self._request('signup', 'POST', url, json=body)
+            if response is not None and response.status_code == 200:
                 print(f'Created user {username}')
                 credentials.append((username, password))
             else:
@@ -80,12 +116,15 @@ class Bot:
         """ Logs in user, returning auth token or None if could not create. """
         url = 'http://localhost:8000/token/'
         oauth = OAuth2Session(client=LegacyApplicationClient(client_id=''))
+        started_at = time.perf_counter()
         try:
             token = oauth.fetch_token(token_url=url, username=username, password=password)
-        except Exception:
+        except Exception as e:
             token = None
+            self.stats.record('token', time.perf_counter() - started_at, type(e).__name__)
             print(f'Could not log in user {username}')
         else:
+            self.stats.record('token', time.perf_counter() - started_at)
             print(f'Logged in user {username}')
         return token
 
@@ -101,11 +140,11 @@ class Bot:
     def create_post(self, auth_headers) -> Optional[int]:
         """ Creates post, returning post_id or None if could not create. """
         url = 'http://localhost:8000/api/posts/'
-        title = next(self._word_cycle)
+        title = self._words.unique_word()
         number_of_words_in_body = random.randrange(self.MIN_WORDS_IN_POST, self.MAX_WORDS_IN_POST + 1)
-        body = ' '.join(next(self._word_cycle) for _ in range(number_of_words_in_body))
-        response = requests.post(url, headers=auth_headers, json={'title': title, 'body': body})
-        if response.status_code == 200:
+        body = ' '.join(next(self._words) for _ in range(number_of_words_in_body))
+        response = self._request('create_post', 'POST', url, headers=auth_headers, json={'title': title, 'body': body})
+        if response is not None and response.status_code == 200:
             print(f'Created post "{title}"')
             return response.json()['id']
         else:
@@ -124,12 +163,46 @@ class Bot:
 
     def like_post(self, post_id: int, auth_headers):
         url = f'http://localhost:8000/api/posts/{post_id}/like/'
-        response = requests.post(url, headers=auth_headers)
-        if response.status_code == 200:
+        response = self._request('like', 'POST', url, headers=auth_headers)
+        if response is not None and response.status_code == 200:
             print(f'Liked post {post_id}')
         else:
             print(f'Could not like post {post_id}')
 
+    def unlike_post(self, post_id: int, auth_headers):
+        url = f'http://localhost:8000/api/posts/{post_id}/like/'
+        response = self._request('unlike', 'DELETE', url, headers=auth_headers)
+        if response is not None and response.status_code == 200:
+            print(f'Unliked post {post_id}')
+        else:
+            print(f'Could not unlike post {post_id}')
+
+    def list_posts(self):
+        url = 'http://localhost:8000/api/posts/'
+        response = self._request('list_posts', 'GET', url)
+        if response is not None and response.status_code == 200:
+            print(f'Listed {len(response.json()["posts"])} posts')
+        else:
+            print('Could not list posts')
+
+    def get_post(self, post_id: int):
+        url = f'http://localhost:8000/api/posts/{post_id}/'
+        response = self._request('get_post', 'GET', url)
+        if response is not None and response.status_code == 200:
+            print(f'Got post {post_id}')
+        else:
+            print(f'Could not get post {post_id}')
+
+    def get_like_stats(self):
+        url = 'http://localhost:8000/api/analytics/post_likes/'
+        date_to = date.today()
+        params = {'date_from': date_to - timedelta(days=self.ANALYTICS_DAYS - 1), 'date_to': date_to}
+        response = self._request('analytics', 'GET', url, params=params)
+        if response is not None and response.status_code == 200:
+            print(f'Got like stats for {self.ANALYTICS_DAYS} days')
+        else:
+            print('Could not get like stats')
+
     def like_posts(self, auth_headers_list, post_id_list):
         assert self._max_likes_per_user
         for user_auth_headers in auth_headers_list:
@@ -139,16 +212,50 @@ class Bot:
             for post_id in post_ids_to_like:
                 self.like_post(post_id, user_auth_headers)
 
+    def run_scenario(self, auth_headers_list, post_id_list):
+        """ Runs scenario_requests actions picked according to scenario weights, one at a time. """
+        scenario_actions = {
+            'list_posts': lambda: self.list_posts(),
+            'get_post': lambda: self.get_post(random.choice(post_id_list)),
+            'analytics': lambda: self.get_like_stats(),
+            'create_post': lambda: self.create_post(random.choice(auth_headers_list)),
+            'like': lambda: self.like_post(random.choice(post_id_list), random.choice(auth_headers_list)),
+            'unlike': lambda: self.unlike_post(random.choice(post_id_list), random.choice(auth_headers_list)),
+        }
+        unknown_actions = set(self._scenario) - set(scenario_actions)
+        assert not unknown_actions, f'Unknown scenario actions: {unknown_actions}'
+        assert auth_headers_list and post_id_list
+        actions = random.choices(
+            list(self._scenario), weights=list(self._scenario.values()), k=self._scenario_requests,
+        )
+        for action in actions:
+            scenario_actions[action]()
+
     def run_actions(self):
         user_credentials_list: list[tuple[str, str]] = self.create_users()
         tokens = self.log_in_users(user_credentials_list)
         auth_headers_list = [self.get_auth_headers(token) for token in tokens]
         post_id_list = self.create_posts(auth_headers_list)
         self.like_posts(auth_headers_list, post_id_list)
+        self.list_posts()
+        self.get_like_stats()
+        if auth_headers_list and post_id_list:
+            self.unlike_post(random.choice(post_id_list), random.choice(auth_headers_list))
+        if self._scenario:
+            self.run_scenario(auth_headers_list, post_id_list)
+        self.stats.report(self._report_json_path, self._report_csv_path)
 
 
 if __name__ == '__main__':
     os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
-    bot = Bot()
-    bot.read_config_from_file('bot_config.json')
-    bot.run_actions()
+    config_file_path = 'bot_config.json'
+    with open(config_file_path) as config_file:
+        mode = json.load(config_file).get('mode', 'sync')
+    if mode == 'async':
+        async_bot = AsyncBot()
+        async_bot.read_config_from_file(config_file_path)
+        asyncio.run(async_bot.run_actions())
+    else:
+        bot = Bot()
+        bot.read_config_from_file(config_file_path)
+        bot.run_actions()
@@ -0,0 +1,114 @@
+import csv
+import json
+import math
+import time
+from collections import Counter, defaultdict
+from typing import Optional
+
+OK = 'ok'
+
+
+class LatencyHistogram:
+    """ Latency histogram with logarithmic buckets, so percentiles are accurate to about 2% in constant memory. """
+
+    BUCKET_GROWTH = 1.02
+    MIN_LATENCY = 0.0001
+
+    def __init__(self):
+        self._buckets: Counter[int] = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, latency: float) -> None:
+        bucket = max(0, math.ceil(math.log(max(latency, self.MIN_LATENCY) / self.MIN_LATENCY, self.BUCKET_GROWTH)))
+        self._buckets[bucket] += 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def percentile(self, fraction: float) -> float:
+        """ Returns upper bound of the bucket that contains the given fraction of recorded latencies. """
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= rank:
+                return min(self.max, self.MIN_LATENCY * self.BUCKET_GROWTH ** bucket)
+        return self.max
+
+
+class RunStats:
+    """ Latencies and outcomes of bot requests, grouped by action. """
+
+    def __init__(self):
+        self._histograms: defaultdict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+        self._outcomes: defaultdict[str, Counter[str]] = defaultdict(Counter)
+        self._started_at = time.perf_counter()
+        self._finished_at: Optional[float] = None
+
+    def record(self, action: str, latency: float, outcome: str = OK) -> None:
+        """ Records a request. outcome is OK, or a failure type like 'http_409' or 'connection_error'. """
+        self._histograms[action].record(latency)
+        self._outcomes[action][outcome] += 1
+
+    def finish(self) -> None:
+        self._finished_at = time.perf_counter()
+
+    def summary(self) -> list[dict]:
+        duration = (self._finished_at or time.perf_counter()) - self._started_at
+        rows = []
+        for action, histogram in sorted(self._histograms.items()):
+            outcomes = self._outcomes[action]
+            rows.append({
+                'action': action,
+                'requests': histogram.count,
+                'failures': histogram.count - outcomes[OK],
+                'failure_types': {outcome: count for outcome, count in outcomes.items() if outcome != OK},
+                'requests_per_second': round(histogram.count / duration, 2),
+                'mean_ms': round(histogram.total / histogram.count * 1000, 2),
+                'p50_ms': round(histogram.percentile(0.5) * 1000, 2),
+                'p95_ms': round(histogram.percentile(0.95) * 1000, 2),
+                'p99_ms': round(histogram.percentile(0.99) * 1000, 2),
+                'max_ms': round(histogram.max * 1000, 2),
+            })
+        return rows
+
+    def print_summary(self) -> None:
+        print(
+            f'{"action":<12} {"requests":>9} {"failures":>9} {"req/s":>9} '
+            f'{"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"max ms":>9}'
+        )
+        for row in self.summary():
+            print(
+                f'{row["action"]:<12} {row["requests"]:>9} {row["failures"]:>9} {row["requests_per_second"]:>9} '
+                f'{row["p50_ms"]:>9} {row["p95_ms"]:>9} {row["p99_ms"]:>9} {row["max_ms"]:>9}'
+            )
+            if row['failure_types']:
+                print(f'{"":<12} failures: {row["failure_types"]}')
+
+    def export_json(self, file_path: str) -> None:
+        with open(file_path, 'w') as json_file:
+            json.dump(self.summary(), json_file, indent=2)
+
+    def export_csv(self, file_path: str) -> None:
+        rows = self.summary()
+        with open(file_path, 'w', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=list(rows[0]) if rows else ['action'])
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({**row, 'failure_types': json.dumps(row['failure_types'])})
+
+    def report(self, json_path: Optional[str] = None, csv_path: Optional[str] = None) -> None:
+        self.finish()
+        self.print_summary()
+        if json_path:
+            self.export_json(json_path)
+        if csv_path:
+            self.export_csv(csv_path)
+
+
+def get_outcome(status_code: int) -> str:
+    return OK if 200 <= status_code < 300 else f'http_{status_code}'
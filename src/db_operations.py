@@ -1,13 +1,29 @@
-from collections import defaultdict
-from datetime import date, datetime
-from typing import Optional
+import sys
+from datetime import date, datetime, time, timedelta
+from time import perf_counter
+from typing import AsyncIterator, Optional, Union
 
-from asyncpg import UniqueViolationError, ForeignKeyViolationError
+import asyncpg
+import databases
+from asyncpg import UniqueViolationError
 from dateutil import rrule
-from sqlalchemy import cast, Date, select, func, sql
+from sqlalchemy import any_, bindparam, cast, Date, select, func, sql, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-from db_schema import post_table, database, user_table, like_table
+from cache import TTLCache
+from db_routing import replica_router
+from db_schema import post_table, database, user_table, like_table, like_daily_table, SEARCH_CONFIG, \
+    USERNAME_BYTE_ORDER
+from instrumentation import record_query
 from models import Post, UserAuth, User, RowCreationResult
+from monitoring import register_stats
+from prepared_query import PreparedQuery
+from response_cache import POSTS, USERS, response_cache
+from settings import USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS
+
+# Authenticated users by username. Entries are dropped on login; last_visit of a cached user may lag by up to the ttl.
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+register_stats('user_cache', user_cache.stats)
 
 
 async def insert_user(username: str, password_hash: str) -> bool:
@@ -16,6 +32,7 @@ async def insert_user(username: str, password_hash: str) -> bool:
         await database.execute(query)
     except UniqueViolationError:
         return False
+    await response_cache.invalidate(USERS)
     return True
 
 
@@ -25,132 +42,634 @@ async def insert_post(author_id: int, title: str, body: str) -> Optional[int]:
         post_id = await database.execute(query)
     except UniqueViolationError:
         return None
+    await response_cache.invalidate(POSTS)
     return post_id
 
 
-async def select_posts(post_ids: list[int] = None) -> list[Post]:
-    query = post_table.join(user_table).select().with_only_columns([
+POST_COLUMNS = [
+    post_table.c.id,
+    post_table.c.title,
+    post_table.c.body,
+    post_table.c.like_count,
+    user_table.c.id,
+    user_table.c.username,
+    user_table.c.last_visit,
+    user_table.c.last_login,
+]
+
+
+async def insert_posts(author_id: int, posts: list[tuple[str, str]]) -> list[Optional[int]]:
+    """
+    Inserts many (title, body) posts with a single statement.
+
+    Returns post ids in the same order, with None for posts whose title is already taken,
+    including repeated titles within the batch itself.
+    """
+    query = """
+        INSERT INTO post (author_id, title, body)
+        SELECT CAST(:author_id AS INTEGER), new_post.title, new_post.body
+        FROM unnest(CAST(:titles AS VARCHAR[]), CAST(:bodies AS VARCHAR[])) AS new_post (title, body)
+        ON CONFLICT (title) DO NOTHING
+        RETURNING id, title
+    """
+    values = {
+        'author_id': author_id,
+        'titles': [title for title, _ in posts],
+        'bodies': [body for _, body in posts],
+    }
+    rows = await database.fetch_all(query=query, values=values)
+    if rows:
+        await response_cache.invalidate(POSTS)
+    post_id_by_title = {row['title']: row['id'] for row in rows}
+    # pop() gives the id only to the first post with a given title.
+    return [post_id_by_title.pop(title, None) for title, _ in posts]
+
+
+def _get_post_from_row(row) -> Post:
+    return Post(
+        id=row[0],
+        title=row[1],
+        body=row[2],
+        like_count=row[3],
+        author=User(
+            id=row[4],
+            username=row[5],
+            last_visit=row[6],
+            last_login=row[7],
+        ),
+    )
+
+
+def _get_post_dict_from_row(row) -> dict:
+    """ Same as _get_post_from_row, but plain data that can be serialized to JSON without pydantic. """
+    return {
+        'id': row[0],
+        'title': row[1],
+        'body': row[2],
+        'author': {
+            'id': row[4],
+            'username': row[5],
+            'last_visit': row[6],
+            'last_login': row[7],
+        },
+        'like_count': row[3],
+    }
+
+
+def _select_posts_query():
+    return post_table.join(user_table).select().with_only_columns(POST_COLUMNS).order_by(post_table.c.id)
+
+
+_select_posts_by_id = PreparedQuery(
+    _select_posts_query().where(post_table.c.id == any_(bindparam('post_ids'))),
+)
+# Post ids are positive, so after_id=0 starts from the beginning, and limit=None (LIMIT NULL) means no limit.
+_select_posts_page = PreparedQuery(
+    _select_posts_query().where(post_table.c.id > bindparam('after_id')).limit(bindparam('limit')),
+)
+_select_author_posts_page = PreparedQuery(
+    _select_posts_query().where(
+        post_table.c.author_id == bindparam('author_id'),
+    ).where(
+        post_table.c.id > bindparam('after_id'),
+    ).limit(bindparam('limit')),
+)
+
+
+async def _select_post_rows(
+        post_ids: Optional[list[int]],
+        author_id: Optional[int],
+        after_id: Optional[int],
+        limit: Optional[int],
+) -> list:
+    if post_ids is not None:
+        return await _select_posts_by_id.fetch_all(database, post_ids=post_ids)
+    if author_id is not None:
+        return await _select_author_posts_page.fetch_all(
+            replica_router.get(), author_id=author_id, after_id=after_id or 0, limit=limit,
+        )
+    return await _select_posts_page.fetch_all(replica_router.get(), after_id=after_id or 0, limit=limit)
+
+
+async def select_posts(
+        post_ids: list[int] = None,
+        *,
+        author_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+) -> list[Post]:
+    """
+    Returns posts with given ids, or a page of all posts or posts of the author if post_ids is None.
+
+    Pages are read from a replica. Posts by id are read from the primary, since they are usually
+    requested right after being created.
+    """
+    rows = await _select_post_rows(post_ids, author_id, after_id, limit)
+    return [_get_post_from_row(row) for row in rows]
+
+
+async def select_post_dicts(
+        post_ids: list[int] = None,
+        *,
+        author_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+) -> list[dict]:
+    """ Same as select_posts, but returns plain dicts to be serialized to JSON directly. """
+    rows = await _select_post_rows(post_ids, author_id, after_id, limit)
+    return [_get_post_dict_from_row(row) for row in rows]
+
+
+async def select_liked_posts(user_id: int, *, after_id: Optional[int] = None, limit: int) -> list[Post]:
+    """ Returns posts liked by the user, ordered by post id. """
+    liked_posts = post_table.join(user_table).join(like_table, like_table.c.post_id == post_table.c.id)
+    query = liked_posts.select().with_only_columns(POST_COLUMNS).where(
+        like_table.c.user_id == user_id,
+    ).order_by(like_table.c.post_id).limit(limit)
+    if after_id is not None:
+        query = query.where(like_table.c.post_id > after_id)
+    results = await replica_router.get().fetch_all(query)
+    return [_get_post_from_row(row) for row in results]
+
+
+async def search_posts(
+        text: str,
+        *,
+        after: Optional[tuple[float, int]] = None,
+        limit: int,
+) -> list[tuple[Post, float]]:
+    """
+    Returns posts matching a web search style query ("quoted phrases", OR, -excluded words) with their rank,
+    best matches first. after is the (rank, id) of the last post of the previous page.
+    """
+    search_query = func.websearch_to_tsquery(sql.literal_column(f"'{SEARCH_CONFIG}'::regconfig"), text)
+    rank = func.ts_rank_cd(post_table.c.search_vector, search_query)
+    ranked_posts = select([
         post_table.c.id,
+        post_table.c.author_id,
         post_table.c.title,
         post_table.c.body,
+        post_table.c.like_count,
+        rank.label('rank'),
+    ]).where(
+        post_table.c.search_vector.op('@@')(search_query),
+    ).order_by(rank.desc(), post_table.c.id.desc()).limit(limit)
+    if after is not None:
+        ranked_posts = ranked_posts.where(sql.tuple_(rank, post_table.c.id) < sql.tuple_(*after))
+    # Authors are joined to the page only; joined before the limit, postgres may hash the whole user table.
+    ranked_posts = ranked_posts.alias('ranked_post')
+    query = select([
+        ranked_posts.c.id,
+        ranked_posts.c.title,
+        ranked_posts.c.body,
+        ranked_posts.c.like_count,
         user_table.c.id,
         user_table.c.username,
         user_table.c.last_visit,
         user_table.c.last_login,
-    ]).order_by(post_table.c.id)
-    if post_ids is not None:
-        query = query.where(post_table.c.id.in_(post_ids))
-    results = await database.fetch_all(query)
-
-    def get_post_from_row(row) -> Post:
-        return Post(
-            id=row[0],
-            title=row[1],
-            body=row[2],
-            author=User(
-                id=row[3],
-                username=row[4],
-                last_visit=row[5],
-                last_login=row[6],
-            ),
-            like_count=post_like_map[row[0]],
-        )
+        ranked_posts.c.rank,
+    ]).select_from(
+        ranked_posts.join(user_table, user_table.c.id == ranked_posts.c.author_id),
+    ).order_by(ranked_posts.c.rank.desc(), ranked_posts.c.id.desc())
+    rows = await replica_router.get().fetch_all(query)
+    return [(_get_post_from_row(row), row['rank']) for row in rows]
 
-    post_like_map = await get_posts_like_count()
 
-    return [get_post_from_row(row) for row in results]
+async def iterate_posts(after_id: Optional[int] = None) -> AsyncIterator[Post]:
+    """ Yields all posts ordered by id, reading them through a server-side cursor. """
+    query = _select_posts_query()
+    if after_id is not None:
+        query = query.where(post_table.c.id > after_id)
+    async for row in replica_router.get().iterate(query):
+        yield _get_post_from_row(row)
 
 
-async def get_posts_like_count() -> defaultdict[int, int]:
-    query = select([
-        like_table.c.post_id,
-        func.count(like_table.c.user_id).label('count'),
-    ]).group_by(
-        like_table.c.post_id,
-    )
-    rows = await database.fetch_all(query)
-    post_like_map = defaultdict(int)
-    for row in rows:
-        post_like_map[row['post_id']] = row['count']
-    return post_like_map
+async def reconcile_post_like_counts(db: databases.Database = database) -> int:
+    """ Recalculates post.like_count from user_like_post, returning the number of corrected posts. """
+    actual = select([
+        post_table.c.id,
+        func.count(like_table.c.post_id).label('like_count'),
+    ]).select_from(
+        post_table.outerjoin(like_table),
+    ).group_by(
+        post_table.c.id,
+    ).alias('actual')
+    query = post_table.update().values(
+        like_count=actual.c.like_count,
+    ).where(
+        post_table.c.id == actual.c.id,
+    ).where(
+        post_table.c.like_count != actual.c.like_count,
+    ).returning(post_table.c.id)
+    rows = await db.fetch_all(query)
+    return len(rows)
 
 
-async def get_post_like_count(post_id: int) -> int:
-    query = like_table.count().where(like_table.c.post_id == post_id)
-    like_count = await database.execute(query)
-    return like_count
+_fetch_user = PreparedQuery(user_table.select().where(user_table.c.username == bindparam('username')))
 
 
 async def fetch_user(username: str) -> Optional[UserAuth]:
-    query = user_table.select().where(user_table.c.username == username)
-    user_dict = await database.fetch_one(query)
+    user_dict = await _fetch_user.fetch_one(database, username=username)
     if user_dict:
         return UserAuth(**user_dict)
 
 
-async def fetch_users() -> list[UserAuth]:
-    query = user_table.select().order_by(user_table.c.id)
-    rows = await database.fetch_all(query)
-    return [UserAuth(**row) for row in rows]
+async def fetch_user_cached(username: str) -> Optional[UserAuth]:
+    """ Same as fetch_user, but served from user_cache when possible. Missing users are not cached. """
+    user_auth = user_cache.get(username)
+    if user_auth is None:
+        user_auth = await fetch_user(username)
+        if user_auth is not None:
+            user_cache.set(username, user_auth)
+    return user_auth
+
+
+async def prepare_hot_queries(connection: asyncpg.Connection) -> None:
+    """ Prepares the read queries most requests make, with values that match no rows. """
+    await _select_posts_by_id.prepare(connection, post_ids=[])
+    await _select_posts_page.prepare(connection, after_id=0, limit=0)
+    await _select_author_posts_page.prepare(connection, author_id=0, after_id=0, limit=0)
+    await _fetch_user.prepare(connection, username='')
+    await _fetch_public_user.prepare(connection, username='')
+
+
+async def preload_user_cache(count: int, ttl: float) -> int:
+    """
+    Puts the authors of the latest posts, who are likely to be active, into user_cache for ttl seconds.
+    Returns their number.
+    """
+    latest_authors = select([post_table.c.author_id]).order_by(post_table.c.id.desc()).limit(count).alias()
+    query = user_table.select().where(user_table.c.id.in_(select([latest_authors.c.author_id])))
+    rows = await replica_router.get().fetch_all(query)
+    for row in rows:
+        user_cache.set(row['username'], UserAuth(**row), ttl=ttl)
+    return len(rows)
+
+
+USER_COLUMNS = [
+    user_table.c.id,
+    user_table.c.username,
+    user_table.c.last_visit,
+    user_table.c.last_login,
+]
+_fetch_public_user = PreparedQuery(select(USER_COLUMNS).where(user_table.c.username == bindparam('username')))
+
+
+async def fetch_public_user(username: str) -> Optional[User]:
+    """
+    Same as fetch_user without the password hash, read from a replica, for pages anyone can see.
+    Unlike fetch_user_cached, it doesn't fill user_cache, which only keeps users who authenticate.
+    """
+    user_dict = await _fetch_public_user.fetch_one(replica_router.get(), username=username)
+    if user_dict:
+        return User(**user_dict)
+
+
+def _get_prefix_upper_bound(prefix: str) -> Optional[str]:
+    """ The smallest string after all strings starting with prefix in byte order, None if there isn't one. """
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    next_char = chr(ord(prefix[-1]) + 1)
+    # Surrogates can't be encoded, so they are never in usernames.
+    if next_char == '\ud800':
+        next_char = '\ue000'
+    return prefix[:-1] + next_char
+
+
+async def _select_user_rows(prefix: Optional[str], after: Optional[Union[int, str]], limit: int) -> list:
+    query = select(USER_COLUMNS).limit(limit)
+    if prefix is None:
+        query = query.order_by(user_table.c.id)
+        if after is not None:
+            query = query.where(user_table.c.id > after)
+    else:
+        # A range of the byte order index rather than LIKE, which needs a constant pattern to use the index.
+        query = query.where(USERNAME_BYTE_ORDER >= prefix).order_by(USERNAME_BYTE_ORDER)
+        upper_bound = _get_prefix_upper_bound(prefix)
+        if upper_bound is not None:
+            query = query.where(USERNAME_BYTE_ORDER < upper_bound)
+        if after is not None:
+            query = query.where(USERNAME_BYTE_ORDER > after)
+    return await replica_router.get().fetch_all(query)
+
+
+async def fetch_users(
+        *,
+        prefix: Optional[str] = None,
+        after: Optional[Union[int, str]] = None,
+        limit: int,
+) -> list[User]:
+    """
+    Returns a page of users, without password hashes, read from a replica.
+
+    Users are ordered by id, and after is the id of the last user of the previous page. With a prefix,
+    only users whose username starts with it are returned, ordered by username bytes, and after is a username.
+    """
+    rows = await _select_user_rows(prefix, after, limit)
+    return [User(**row) for row in rows]
+
+
+async def fetch_user_dicts(
+        *,
+        prefix: Optional[str] = None,
+        after: Optional[Union[int, str]] = None,
+        limit: int,
+) -> list[dict]:
+    """ Same as fetch_users, but returns plain dicts to be serialized to JSON directly. """
+    rows = await _select_user_rows(prefix, after, limit)
+    return [dict(row) for row in rows]
+
+
+_create_likes = PreparedQuery(sql.text("""
+        WITH existing_post AS (
+            SELECT id FROM post WHERE id = ANY(:post_ids)
+        ), inserted_like AS (
+            INSERT INTO user_like_post (user_id, post_id)
+            SELECT CAST(:user_id AS INTEGER), id FROM existing_post
+            ON CONFLICT DO NOTHING
+            RETURNING post_id
+        ), counted_post AS (
+            UPDATE post SET like_count = like_count + 1
+            FROM inserted_like
+            WHERE post.id = inserted_like.post_id
+        )
+        SELECT existing_post.id, inserted_like.post_id IS NOT NULL AS created
+        FROM existing_post LEFT JOIN inserted_like ON inserted_like.post_id = existing_post.id
+"""))
+
+
+async def create_likes(user_id: int, post_ids: list[int]) -> dict[int, RowCreationResult]:
+    """
+    Likes many posts with a single statement.
+
+    Returns result for every post id: CREATED, UNIQUE_VIOLATION if it was already liked
+    or FOREIGN_KEY_VIOLATION if there is no such post.
+    """
+    rows = await _create_likes.fetch_all(database, user_id=user_id, post_ids=list(set(post_ids)))
+    results = {post_id: RowCreationResult.FOREIGN_KEY_VIOLATION for post_id in post_ids}
+    for row in rows:
+        results[row['id']] = RowCreationResult.CREATED if row['created'] else RowCreationResult.UNIQUE_VIOLATION
+    if any(row['created'] for row in rows):
+        # Cached posts include like counts.
+        await response_cache.invalidate(POSTS)
+    return results
 
 
 async def create_like(user_id: int, post_id: int) -> RowCreationResult:
-    query = like_table.insert().values(user_id=user_id, post_id=post_id)
-    try:
-        await database.execute(query)
-    except UniqueViolationError:
-        return RowCreationResult.UNIQUE_VIOLATION
-    except ForeignKeyViolationError:
-        return RowCreationResult.FOREIGN_KEY_VIOLATION
-    return RowCreationResult.CREATED
+    results = await create_likes(user_id, [post_id])
+    return results[post_id]
 
 
-async def delete_like(user_id: int, post_id: int) -> bool:
-    """ Returns True if like was deleted, False otherwise (when like not existed). """
-    query = like_table.delete(returning=[like_table.c.user_id]).where(
-        like_table.c.user_id == user_id,
-    ).where(
-        like_table.c.post_id == post_id,
+# Likes of past days are already counted in post_like_daily, so the rollup is decremented too.
+# A user likes a post at most once, so every post and day loses at most one like.
+_delete_likes = PreparedQuery(sql.text("""
+        WITH deleted_like AS (
+            DELETE FROM user_like_post
+            WHERE user_id = :user_id AND post_id = ANY(:post_ids)
+            RETURNING post_id, datetime
+        ), counted_post AS (
+            UPDATE post SET like_count = like_count - 1
+            FROM deleted_like
+            WHERE post.id = deleted_like.post_id
+        ), counted_day AS (
+            UPDATE post_like_daily SET count = count - 1
+            FROM deleted_like
+            WHERE post_like_daily.date = CAST(deleted_like.datetime AS DATE)
+                AND post_like_daily.post_id = deleted_like.post_id
+        )
+        SELECT post_id, CAST(extract(epoch FROM statement_timestamp() - datetime) AS DOUBLE PRECISION) AS like_age
+        FROM deleted_like
+"""))
+
+
+async def delete_likes(user_id: int, post_ids: list[int]) -> dict[int, float]:
+    """
+    Unlikes many posts with a single statement.
+
+    Returns how many seconds ago each deleted like was made by post id; posts that weren't liked are left out.
+    """
+    rows = await _delete_likes.fetch_all(database, user_id=user_id, post_ids=list(set(post_ids)))
+    if rows:
+        await response_cache.invalidate(POSTS)
+    return {row['post_id']: row['like_age'] for row in rows}
+
+
+async def delete_like(user_id: int, post_id: int) -> Optional[float]:
+    """ Returns how many seconds ago the deleted like was made, or None if there was no such like. """
+    like_ages = await delete_likes(user_id, [post_id])
+    return like_ages.get(post_id)
+
+
+_LIKE_STAGING_COLUMNS = ['user_id', 'post_id', 'liked', 'age']
+# Temporary tables belong to the connection, so concurrent merges never see each other's rows.
+_create_like_staging = """
+    CREATE TEMPORARY TABLE IF NOT EXISTS like_staging (
+        user_id INTEGER NOT NULL,
+        post_id INTEGER NOT NULL,
+        liked BOOLEAN NOT NULL,
+        age DOUBLE PRECISION NOT NULL
+    ) ON COMMIT DELETE ROWS
+"""
+# Same as create_likes and delete_like for all staged rows at once. A post's like_count can get both
+# new and removed likes, which a single UPDATE ... FROM row wouldn't apply, so changes are summed per post first.
+_merge_like_staging = """
+    WITH deleted_like AS (
+        DELETE FROM user_like_post
+        USING like_staging
+        WHERE NOT like_staging.liked
+            AND user_like_post.user_id = like_staging.user_id
+            AND user_like_post.post_id = like_staging.post_id
+        RETURNING user_like_post.post_id, user_like_post.datetime
+    ), inserted_like AS (
+        INSERT INTO user_like_post (user_id, post_id, datetime)
+        SELECT like_staging.user_id, like_staging.post_id,
+            statement_timestamp() - make_interval(secs => like_staging.age)
+        FROM like_staging
+        JOIN post ON post.id = like_staging.post_id
+        JOIN app_user ON app_user.id = like_staging.user_id
+        WHERE like_staging.liked
+        ON CONFLICT DO NOTHING
+        RETURNING post_id
+    ), like_change AS (
+        SELECT post_id, sum(change) AS change
+        FROM (
+            SELECT post_id, 1 AS change FROM inserted_like
+            UNION ALL
+            SELECT post_id, -1 FROM deleted_like
+        ) AS changed_like
+        GROUP BY post_id
+    ), counted_post AS (
+        UPDATE post SET like_count = like_count + like_change.change
+        FROM like_change
+        WHERE post.id = like_change.post_id
+    ), deleted_day AS (
+        SELECT CAST(datetime AS DATE) AS date, post_id, count(*) AS count
+        FROM deleted_like
+        GROUP BY 1, 2
+    ), counted_day AS (
+        UPDATE post_like_daily SET count = post_like_daily.count - deleted_day.count
+        FROM deleted_day
+        WHERE post_like_daily.date = deleted_day.date AND post_like_daily.post_id = deleted_day.post_id
     )
-    result = await database.execute(query)
-    if result is None:
-        return False
-    return True
+    SELECT post_id, NULL AS like_age FROM inserted_like
+    UNION ALL
+    SELECT post_id, CAST(extract(epoch FROM statement_timestamp() - datetime) AS DOUBLE PRECISION)
+    FROM deleted_like
+"""
 
 
-async def update_last_visit(user_id: int) -> None:
-    query = user_table.update().values(
-        last_visit=datetime.now(),
-    ).where(user_table.c.id == user_id)
-    await database.execute(query)
+async def merge_likes(changes: list[tuple[int, int, bool, float]]) -> tuple[list[int], list[tuple[int, float]]]:
+    """
+    Likes and unlikes many posts by many users at once: (user_id, post_id, liked, age) changes are COPYed
+    into a staging table and merged with a single statement. There must be one change per (user_id, post_id),
+    age is how many seconds ago it was made, and likes of posts or users that don't exist are skipped.
+
+    Returns post ids of created likes and (post id, like age) of removed likes, like delete_like.
+    """
+    async with database.connection() as connection:
+        async with connection.transaction():
+            raw_connection = connection.raw_connection
+            started_at = perf_counter()
+            await raw_connection.execute(_create_like_staging)
+            await raw_connection.copy_records_to_table('like_staging', records=changes, columns=_LIKE_STAGING_COLUMNS)
+            rows = await raw_connection.fetch(_merge_like_staging)
+            record_query(_merge_like_staging, perf_counter() - started_at)
+    created = [row['post_id'] for row in rows if row['like_age'] is None]
+    removed = [(row['post_id'], row['like_age']) for row in rows if row['like_age'] is not None]
+    if rows:
+        await response_cache.invalidate(POSTS)
+    return created, removed
+
+
+async def select_post_like_scores(window_seconds: float, half_life_seconds: float) -> dict[int, float]:
+    """
+    Returns time-decayed like scores of posts liked within the window: each like weighs 1 when it's made,
+    halving every half_life_seconds since.
+    """
+    query = """
+        SELECT post_id, sum(power(
+            0.5,
+            extract(epoch FROM statement_timestamp() - datetime) / CAST(:half_life_seconds AS DOUBLE PRECISION)
+        )) AS score
+        FROM user_like_post
+        WHERE datetime > statement_timestamp() - make_interval(secs => CAST(:window_seconds AS DOUBLE PRECISION))
+        GROUP BY post_id
+    """
+    values = {'window_seconds': window_seconds, 'half_life_seconds': half_life_seconds}
+    rows = await replica_router.get().fetch_all(query=query, values=values)
+    return {row['post_id']: float(row['score']) for row in rows}
+
+
+async def update_last_visits(visits: dict[int, datetime], batch_size: int = 1000) -> None:
+    """ Sets last_visit for many users at once, with one UPDATE ... FROM (VALUES ...) per batch. """
+    visit_list = list(visits.items())
+    for start in range(0, len(visit_list), batch_size):
+        batch = visit_list[start:start + batch_size]
+        values = {}
+        rows = []
+        for i, (user_id, last_visit) in enumerate(batch):
+            values[f'user_id_{i}'] = user_id
+            values[f'last_visit_{i}'] = last_visit
+            rows.append(f'(CAST(:user_id_{i} AS INTEGER), CAST(:last_visit_{i} AS TIMESTAMP))')
+        query = (
+            f'UPDATE app_user SET last_visit = visit.last_visit '
+            f'FROM (VALUES {", ".join(rows)}) AS visit (user_id, last_visit) '
+            f'WHERE app_user.id = visit.user_id'
+        )
+        await database.execute(query=query, values=values)
 
 
 async def update_last_login(user_id: int) -> None:
     query = user_table.update().values(
         last_login=datetime.now(),
-    ).where(user_table.c.id == user_id)
-    await database.execute(query)
+    ).where(user_table.c.id == user_id).returning(user_table.c.username)
+    username = await database.execute(query)
+    user_cache.pop(username)
 
 
-async def get_post_like_stats(date_from: date, date_to: date) -> dict[date, dict]:
-    like_date = cast(like_table.c.datetime, Date).label('date')
-    query = select([
+async def refresh_post_like_daily(db: databases.Database = database) -> None:
+    """ Rolls up likes of the complete days that are not in post_like_daily yet. """
+    last_rolled_up_date = await db.fetch_val(select([func.max(like_daily_table.c.date)]))
+    like_date = cast(like_table.c.datetime, Date)
+    likes_per_day = select([
         like_date,
         like_table.c.post_id,
-        func.count(like_table.c.user_id).label('count'),
+        func.count(like_table.c.user_id),
     ]).where(
-        sql.and_(
-            like_date >= date_from,
-            like_date <= date_to,
-        )
+        like_table.c.datetime < func.current_date(),
     ).group_by(
         like_date,
         like_table.c.post_id,
-    ).order_by(
-        like_date,
-        like_table.c.post_id,
     )
-    rows = await database.fetch_all(query)
+    if last_rolled_up_date is not None:
+        likes_per_day = likes_per_day.where(
+            like_table.c.datetime >= datetime.combine(last_rolled_up_date + timedelta(days=1), time()),
+        )
+    query = pg_insert(like_daily_table).from_select(
+        [like_daily_table.c.date, like_daily_table.c.post_id, like_daily_table.c.count],
+        likes_per_day,
+    )
+    query = query.on_conflict_do_update(
+        index_elements=[like_daily_table.c.date, like_daily_table.c.post_id],
+        set_={'count': query.excluded.count},
+    )
+    await db.execute(query)
+
+
+async def rebuild_post_like_daily(db: databases.Database = database) -> None:
+    """ Recalculates post_like_daily from scratch. """
+    async with db.transaction():
+        await db.execute(like_daily_table.delete())
+        await refresh_post_like_daily(db)
+
+
+async def _select_post_like_stats(db: databases.Database, date_from: date, date_to: date):
+    """
+    Builds a (date, post_id, count) subquery of like counts within the range.
+
+    Days already rolled up into post_like_daily are read from it, only the rest (normally just today)
+    is counted from user_like_post.
+    """
+    last_rolled_up_date = await db.fetch_val(select([func.max(like_daily_table.c.date)]))
+    query = select([
+        like_daily_table.c.date,
+        like_daily_table.c.post_id,
+        like_daily_table.c.count,
+    ]).where(
+        sql.and_(
+            like_daily_table.c.date >= date_from,
+            like_daily_table.c.date <= date_to,
+            like_daily_table.c.count > 0,
+        )
+    )
+    raw_date_from = date_from
+    if last_rolled_up_date is not None:
+        raw_date_from = max(date_from, last_rolled_up_date + timedelta(days=1))
+    if raw_date_from <= date_to:
+        like_date = cast(like_table.c.datetime, Date)
+        raw_query = select([
+            like_date.label('date'),
+            like_table.c.post_id,
+            func.count(like_table.c.user_id).label('count'),
+        ]).where(
+            sql.and_(
+                like_table.c.datetime >= datetime.combine(raw_date_from, time()),
+                like_table.c.datetime < datetime.combine(date_to + timedelta(days=1), time()),
+            )
+        ).group_by(
+            like_date,
+            like_table.c.post_id,
+        )
+        query = union_all(query, raw_query)
+    return query.alias('likes')
+
+
+async def get_post_like_stats(date_from: date, date_to: date) -> dict[date, dict]:
+    db = replica_router.get()
+    likes = await _select_post_like_stats(db, date_from, date_to)
+    query = select([likes]).order_by(likes.c.date, likes.c.post_id)
+    rows = await db.fetch_all(query)
 
     result: dict[date, dict] = {}
     all_dates = rrule.rrule(rrule.DAILY, dtstart=date_from, until=date_to)
@@ -162,3 +681,22 @@ async def get_post_like_stats(date_from: date, date_to: date) -> dict[date, dict
         day_likes['total'] = sum(day_likes.values())
 
     return result
+
+
+async def get_post_like_stats_columnar(date_from: date, date_to: date) -> dict[str, list]:
+    """ Same counts as get_post_like_stats, as parallel arrays aggregated by postgres. Days without likes are omitted. """
+    db = replica_router.get()
+    likes = await _select_post_like_stats(db, date_from, date_to)
+    # All three aggregates consume the same sorted rows, so the arrays stay aligned with each other.
+    sorted_likes = select([likes]).order_by(likes.c.date, likes.c.post_id).alias('sorted_likes')
+    query = select([
+        func.array_agg(sorted_likes.c.date).label('dates'),
+        func.array_agg(sorted_likes.c.post_id).label('post_ids'),
+        func.array_agg(sorted_likes.c.count).label('counts'),
+    ])
+    row = await db.fetch_one(query)
+    return {
+        'dates': row['dates'] or [],
+        'post_ids': row['post_ids'] or [],
+        'counts': row['counts'] or [],
+    }
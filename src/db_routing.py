@@ -0,0 +1,94 @@
+import asyncio
+import itertools
+import logging
+
+import databases
+
+from background import PeriodicTask
+from db_schema import database, replica_databases
+from monitoring import register_stats
+from settings import REPLICA_HEALTH_CHECK_INTERVAL_SECONDS, REPLICA_HEALTH_CHECK_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaRouter:
+    """
+    Picks the database for read-only queries: healthy replicas in round-robin, or the primary if there are none.
+
+    Replicas are checked every health check interval and left out of rotation while they fail the check,
+    so a replica going down costs at most one interval of failed reads. Replicas lag behind the primary,
+    so reads that must see the caller's own writes should use the primary directly.
+    """
+
+    def __init__(
+            self,
+            primary: databases.Database,
+            replicas: list[databases.Database],
+            health_check_interval: float,
+            health_check_timeout: float,
+    ):
+        self._primary = primary
+        self._replicas = replicas
+        self._healthy: list[databases.Database] = []
+        self._checked = False
+        self._counter = itertools.count()
+        self._health_check_timeout = health_check_timeout
+        self._health_checker = PeriodicTask('replica_health_check', health_check_interval, self.check_health)
+        self.replica_reads = 0
+        self.primary_reads = 0
+
+    def get(self) -> databases.Database:
+        if not self._healthy:
+            self.primary_reads += 1
+            return self._primary
+        self.replica_reads += 1
+        return self._healthy[next(self._counter) % len(self._healthy)]
+
+    async def _is_healthy(self, replica: databases.Database) -> bool:
+        was_healthy = replica in self._healthy
+        try:
+            if not replica.is_connected:
+                await asyncio.wait_for(replica.connect(), self._health_check_timeout)
+            await asyncio.wait_for(replica.fetch_val('SELECT 1'), self._health_check_timeout)
+        except Exception as e:
+            if was_healthy or not self._checked:
+                logger.warning('Replica %s is unavailable: %r', self._replicas.index(replica), e)
+            return False
+        if not was_healthy and self._checked:
+            logger.warning('Replica %s is available again', self._replicas.index(replica))
+        return True
+
+    async def check_health(self) -> None:
+        results = await asyncio.gather(*(self._is_healthy(replica) for replica in self._replicas))
+        self._healthy = [replica for replica, is_healthy in zip(self._replicas, results) if is_healthy]
+        self._checked = True
+
+    async def connect(self) -> None:
+        """ Connects to the replicas; the ones that can't be reached are retried by the health check. """
+        if not self._replicas:
+            return
+        await self.check_health()
+        self._health_checker.start()
+
+    async def disconnect(self) -> None:
+        await self._health_checker.stop()
+        self._healthy = []
+        self._checked = False
+        for replica in self._replicas:
+            if replica.is_connected:
+                await replica.disconnect()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'replicas': len(self._replicas),
+            'healthy': len(self._healthy),
+            'replica_reads': self.replica_reads,
+            'primary_reads': self.primary_reads,
+        }
+
+
+replica_router = ReplicaRouter(
+    database, replica_databases, REPLICA_HEALTH_CHECK_INTERVAL_SECONDS, REPLICA_HEALTH_CHECK_TIMEOUT_SECONDS,
+)
+register_stats('db_replicas', replica_router.stats)
@@ -1,9 +1,50 @@
+import os
+from typing import Optional
+
 import databases
 import sqlalchemy as sql
+from sqlalchemy.dialects.postgresql import TSVECTOR
 
 metadata = sql.MetaData()
-DATABASE_URL = 'postgresql:///social_network'
-database = databases.Database(DATABASE_URL)
+# Read from the environment directly rather than from settings, since alembic imports this module on its own.
+DATABASE_URL = os.environ.get('DATABASE_URL', 'postgresql:///social_network')
+# Optional comma separated read replicas, read-only queries are routed to them by db_routing.
+DATABASE_REPLICA_URLS = [url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+# Server processes started by serve.py, each with its own pools.
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS', 1))
+# Connections all server processes together may open to each database server, e.g. postgres max_connections
+# minus the ones left for maintenance and other clients. Unless DB_POOL_MAX_SIZE is set, it's split between workers.
+DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', 0))
+if DB_MAX_CONNECTIONS and 'DB_POOL_MAX_SIZE' not in os.environ:
+    POOL_MAX_SIZE = max(1, DB_MAX_CONNECTIONS // WEB_WORKERS)
+else:
+    POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 20))
+POOL_MIN_SIZE = min(int(os.environ.get('DB_POOL_MIN_SIZE', 5)), POOL_MAX_SIZE)
+# Seconds to run a single statement, 0 means no statement timeout.
+COMMAND_TIMEOUT_SECONDS = float(os.environ.get('DB_COMMAND_TIMEOUT_SECONDS', 30)) or None
+_pool_options = dict(
+    # Connections opened on startup and the most the pool will ever open; requests above that wait for a free one.
+    min_size=POOL_MIN_SIZE,
+    max_size=POOL_MAX_SIZE,
+    # Seconds to establish a new connection.
+    timeout=float(os.environ.get('DB_CONNECT_TIMEOUT_SECONDS', 10)),
+    # Prepared statements kept per connection, see prepared_query.py.
+    statement_cache_size=int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 100)),
+    # Idle connections are closed after this many seconds, so the pool shrinks back after a burst.
+    max_inactive_connection_lifetime=float(os.environ.get('DB_MAX_INACTIVE_CONNECTION_LIFETIME_SECONDS', 300)),
+)
+
+
+def create_database(url: str, *, command_timeout: Optional[float] = COMMAND_TIMEOUT_SECONDS) -> databases.Database:
+    """ Database with the configured pool options, command_timeout=None runs statements without a timeout. """
+    return databases.Database(url, command_timeout=command_timeout, **_pool_options)
+
+
+database = create_database(DATABASE_URL)
+replica_databases = [create_database(url) for url in DATABASE_REPLICA_URLS]
+
+# Largest id of the INTEGER id columns; larger ones can't be sent to postgres as query arguments.
+MAX_ID = 2 ** 31 - 1
 
 
 user_table = sql.Table(
@@ -15,6 +56,15 @@ user_table = sql.Table(
     sql.Column('last_visit', sql.DateTime),
     sql.Column('last_login', sql.DateTime),
 )
+# Byte order of usernames whatever the database collation is, so prefix searches are index range scans
+# that are already sorted, like with text_pattern_ops, which can't be used for ORDER BY.
+USERNAME_BYTE_ORDER = user_table.c.username.collate('C')
+sql.Index('ix_app_user_username_c', USERNAME_BYTE_ORDER)
+
+SEARCH_CONFIG = 'english'
+POST_SEARCH_VECTOR_EXPRESSION = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', title), 'A') || setweight(to_tsvector('{SEARCH_CONFIG}', body), 'B')"
+)
 
 post_table = sql.Table(
     'post',
@@ -23,6 +73,11 @@ post_table = sql.Table(
     sql.Column('author_id', sql.Integer, sql.ForeignKey('app_user.id', ondelete='CASCADE'), nullable=False),
     sql.Column('title', sql.String, nullable=False, unique=True),
     sql.Column('body', sql.String, nullable=False),
+    sql.Column('like_count', sql.Integer, server_default='0', nullable=False),
+    # Kept up to date by postgres itself; title words rank higher than body words.
+    sql.Column('search_vector', TSVECTOR, sql.Computed(POST_SEARCH_VECTOR_EXPRESSION), nullable=False),
+    sql.Index('ix_post_author_id_id', 'author_id', 'id'),
+    sql.Index('ix_post_search_vector', 'search_vector', postgresql_using='gin'),
 )
 
 like_table = sql.Table(
@@ -31,4 +86,15 @@ like_table = sql.Table(
     sql.Column('user_id', sql.Integer, sql.ForeignKey('app_user.id', ondelete='CASCADE'), primary_key=True),
     sql.Column('post_id', sql.Integer, sql.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True),
     sql.Column('datetime', sql.DateTime, server_default=sql.func.statement_timestamp(), nullable=False),
+    sql.Index('ix_user_like_post_datetime', 'datetime'),
+    sql.Index('ix_user_like_post_post_id', 'post_id'),
+)
+
+# Likes per post per day, for days before the current one. Kept by refresh_post_like_daily and delete_like.
+like_daily_table = sql.Table(
+    'post_like_daily',
+    metadata,
+    sql.Column('date', sql.Date, primary_key=True),
+    sql.Column('post_id', sql.Integer, sql.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True),
+    sql.Column('count', sql.Integer, nullable=False),
 )
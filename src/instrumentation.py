@@ -0,0 +1,110 @@
+import functools
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Optional
+
+import databases
+from fastapi import Request, Response
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import ClauseElement
+from starlette.routing import Match
+
+from metrics import histogram
+from settings import SLOW_QUERY_THRESHOLD_MS
+
+logger = logging.getLogger(__name__)
+
+request_durations = histogram(
+    'http_request_duration_seconds', 'Time to handle a request, up to the response headers.',
+    ('method', 'route', 'status'),
+)
+request_queries = histogram(
+    'http_request_db_queries', 'Database queries made by a request.',
+    ('method', 'route'), buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+request_query_durations = histogram(
+    'http_request_db_duration_seconds', 'Time a request spent waiting for database queries.', ('method', 'route'),
+)
+query_durations = histogram('db_query_duration_seconds', 'Time of a single database query.')
+
+
+class _RequestQueries:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+_request_queries: ContextVar[Optional[_RequestQueries]] = ContextVar('request_queries', default=None)
+_dialect = postgresql.dialect()
+
+
+def _get_query_text(query: Any) -> str:
+    # str() of a SQLAlchemy query uses the generic compiler, which fails on postgres-only clauses like ON CONFLICT.
+    if isinstance(query, ClauseElement):
+        query = query.compile(dialect=_dialect)
+    return ' '.join(str(query).split())
+
+
+def record_query(query: Any, seconds: float) -> None:
+    """ Accounts a finished query to the metrics and to the request it was made for, if any. """
+    query_durations.observe(seconds)
+    request_queries_so_far = _request_queries.get()
+    if request_queries_so_far is not None:
+        request_queries_so_far.count += 1
+        request_queries_so_far.seconds += seconds
+    if SLOW_QUERY_THRESHOLD_MS and seconds * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+        # Called after the query, often from a finally block, so it must never replace its result or error.
+        try:
+            query_text = _get_query_text(query)
+        except Exception as e:
+            query_text = f'{type(query).__name__} ({e!r})'
+        logger.warning('Slow query took %.1f ms: %s', seconds * 1000, query_text)
+
+
+def _timed(method: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+    @functools.wraps(method)
+    async def timed_method(query, *args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return await method(query, *args, **kwargs)
+        finally:
+            record_query(query, time.perf_counter() - started_at)
+
+    return timed_method
+
+
+def instrument_database(database: databases.Database) -> None:
+    """ Makes every query run through the database's methods recorded by record_query. """
+    for name in ('execute', 'execute_many', 'fetch_all', 'fetch_one', 'fetch_val'):
+        setattr(database, name, _timed(getattr(database, name)))
+
+
+def _get_route_path(request: Request) -> str:
+    # Route templates rather than actual paths, so there is a bounded number of series.
+    for route in request.app.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return 'unmatched'
+
+
+async def timing_middleware(request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
+    """ Records request latency and database usage per route, and reports them in the Server-Timing header. """
+    queries = _RequestQueries()
+    token = _request_queries.set(queries)
+    started_at = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _request_queries.reset(token)
+    seconds = time.perf_counter() - started_at
+
+    route = _get_route_path(request)
+    request_durations.observe(seconds, request.method, route, str(response.status_code))
+    request_queries.observe(queries.count, request.method, route)
+    request_query_durations.observe(queries.seconds, request.method, route)
+    response.headers['Server-Timing'] = (
+        f'app;dur={seconds * 1000:.1f}, db;dur={queries.seconds * 1000:.1f};desc="{queries.count} queries"'
+    )
+    return response
@@ -0,0 +1,58 @@
+from pathlib import Path
+from typing import Optional
+
+from jose import jwk, jwt, JWTError
+
+from settings import JWT_ALGORITHM, JWT_SECRET_KEY, JWT_KEYS_DIR, JWT_KEY_ID
+
+
+class JWTKeys:
+    """
+    Keys for signing and verifying access tokens.
+
+    HS* algorithms use a single shared secret. With RS* and ES* algorithms, keys_dir holds <key id>.pem files:
+    tokens are signed with the private key of key_id and verified with the public key named by their kid header,
+    so keys are rotated by adding a new key, switching key_id to it and removing the old one once the tokens
+    it signed have expired. Other services can verify tokens with the public keys from jwks().
+    """
+
+    def __init__(self, algorithm: str, secret_key: str, keys_dir: Optional[str] = None, key_id: Optional[str] = None):
+        self.algorithm = algorithm
+        self._key_id = None
+        if algorithm.startswith('HS'):
+            self._signing_key = secret_key
+            self._verification_keys = {}
+            return
+        if not keys_dir or not key_id:
+            raise ValueError(f'{algorithm} needs a keys directory and a signing key id')
+        pem_keys = {path.stem: path.read_text() for path in sorted(Path(keys_dir).glob('*.pem'))}
+        if key_id not in pem_keys:
+            raise ValueError(f'No {key_id}.pem key in {keys_dir}')
+        self._key_id = key_id
+        self._signing_key = pem_keys[key_id]
+        self._verification_keys = {
+            kid: jwk.construct(pem_key, algorithm).public_key() for kid, pem_key in pem_keys.items()
+        }
+
+    def encode(self, claims: dict) -> str:
+        headers = {'kid': self._key_id} if self._key_id else None
+        return jwt.encode(claims, self._signing_key, algorithm=self.algorithm, headers=headers)
+
+    def decode(self, token: str) -> dict:
+        """ Returns claims of a valid token, raises JWTError (ExpiredSignatureError if expired) otherwise. """
+        if self._key_id is None:
+            key = self._signing_key
+        else:
+            key = self._verification_keys.get(jwt.get_unverified_header(token).get('kid'))
+            if key is None:
+                raise JWTError('Unknown signing key')
+        return jwt.decode(token, key, algorithms=[self.algorithm])
+
+    def jwks(self) -> dict:
+        """ Public keys as a JSON Web Key Set, empty for shared secret algorithms. """
+        return {
+            'keys': [{**key.to_dict(), 'kid': kid, 'use': 'sig'} for kid, key in self._verification_keys.items()],
+        }
+
+
+jwt_keys = JWTKeys(JWT_ALGORITHM, JWT_SECRET_KEY, JWT_KEYS_DIR, JWT_KEY_ID)
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from background import PeriodicTask
+from db_operations import update_last_visits
+from monitoring import register_stats
+from settings import LAST_VISIT_FLUSH_INTERVAL_MS
+
+
+class LastVisitTracker:
+    """
+    Write-behind buffer for app_user.last_visit.
+
+    Visits are collected in memory, keeping only the latest one per user, and written with a single
+    UPDATE every flush interval, so a busy user costs one row write per interval instead of one per request.
+    """
+
+    def __init__(self, flush_interval_ms: int):
+        self._visits: dict[int, datetime] = {}
+        self._flusher = PeriodicTask('last_visit_flush', flush_interval_ms / 1000, self.flush)
+        self.recorded_visits = 0
+        self.written_rows = 0
+
+    def record(self, user_id: int) -> None:
+        self._visits[user_id] = datetime.now()
+        self.recorded_visits += 1
+
+    async def flush(self) -> None:
+        if not self._visits:
+            return
+        visits, self._visits = self._visits, {}
+        try:
+            await update_last_visits(visits)
+        except Exception:
+            # Put the batch back unless newer visits were recorded meanwhile, so it's retried on the next flush.
+            self._visits = {**visits, **self._visits}
+            raise
+        self.written_rows += len(visits)
+
+    def start(self) -> None:
+        self._flusher.start()
+
+    async def stop(self) -> None:
+        await self._flusher.stop()
+        await self.flush()
+
+    def stats(self) -> dict[str, int]:
+        pending = len(self._visits)
+        return {
+            'recorded_visits': self.recorded_visits,
+            'written_rows': self.written_rows,
+            'pending': pending,
+            'saved_writes': self.recorded_visits - self.written_rows - pending,
+        }
+
+
+last_visit_tracker = LastVisitTracker(LAST_VISIT_FLUSH_INTERVAL_MS)
+register_stats('last_visit', last_visit_tracker.stats)
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from background import PeriodicTask
+from db_operations import merge_likes
+from db_schema import MAX_ID
+from monitoring import register_stats
+from settings import LIKE_BUFFER_FLUSH_INTERVAL_MS, LIKE_BUFFER_FLUSH_SIZE, LIKE_BUFFER_MAX_SIZE, \
+    LIKE_BUFFER_MAX_WAIT_MS
+from trending import trending_posts
+
+logger = logging.getLogger(__name__)
+SHUTDOWN_FLUSH_ATTEMPTS = 5
+
+
+class LikeBufferFullError(Exception):
+    pass
+
+
+class LikeBuffer:
+    """
+    Write-behind buffer for likes and unlikes, for spikes when a write per like can't keep up.
+
+    Changes are collected in memory, keeping only the latest one per user and post, and written with merge_likes
+    every flush interval, or as soon as flush_size of them are pending. Callers only learn that their change
+    was accepted: likes of posts that don't exist are skipped, and reads see changes after the flush.
+    Memory is bounded by max_size pending changes, plus the batch being written: while that many are pending,
+    new changes wait up to max_wait_ms for a flush to finish and are then refused with LikeBufferFullError.
+    """
+
+    def __init__(self, flush_interval_ms: int, flush_size: int, max_size: int, max_wait_ms: int):
+        # (user id, post id) -> (liked, time.monotonic() of the change).
+        self._changes: dict[tuple[int, int], tuple[bool, float]] = {}
+        self._flush_size = flush_size
+        self._max_size = max_size
+        self._max_wait = max_wait_ms / 1000
+        # Set and replaced after every successful flush, waking up changes waiting for space. Created when
+        # the first change waits, in the server's event loop, see PeriodicTask.
+        self._flushed: Optional[asyncio.Event] = None
+        self._flusher = PeriodicTask('like_buffer_flush', flush_interval_ms / 1000, self.flush)
+        self.recorded_changes = 0
+        self.written_changes = 0
+        self.created_likes = 0
+        self.removed_likes = 0
+        self.rejected_changes = 0
+        self.skipped_changes = 0
+
+    async def _record(self, user_id: int, post_id: int, liked: bool) -> None:
+        if not (1 <= user_id <= MAX_ID and 1 <= post_id <= MAX_ID):
+            # There can't be such a post, and it couldn't be written, failing the whole batch on every flush.
+            self.skipped_changes += 1
+            return
+        key = (user_id, post_id)
+        deadline = time.monotonic() + self._max_wait
+        # Replacing a pending change doesn't take more space.
+        while len(self._changes) >= self._max_size and key not in self._changes:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.rejected_changes += 1
+                raise LikeBufferFullError
+            self._flusher.run_soon()
+            if self._flushed is None:
+                self._flushed = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._flushed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        self._changes[key] = (liked, time.monotonic())
+        self.recorded_changes += 1
+        if len(self._changes) >= self._flush_size:
+            self._flusher.run_soon()
+
+    async def like(self, user_id: int, post_id: int) -> None:
+        await self._record(user_id, post_id, True)
+
+    async def unlike(self, user_id: int, post_id: int) -> None:
+        await self._record(user_id, post_id, False)
+
+    async def flush(self) -> None:
+        if not self._changes:
+            return
+        changes, self._changes = self._changes, {}
+        now = time.monotonic()
+        records = [
+            (user_id, post_id, liked, now - changed_at)
+            for (user_id, post_id), (liked, changed_at) in changes.items()
+        ]
+        try:
+            created, removed = await merge_likes(records)
+        except Exception:
+            # Put the batch back unless newer changes were recorded meanwhile, so it's retried on the next flush.
+            self._changes = {**changes, **self._changes}
+            raise
+        if self._flushed is not None:
+            self._flushed.set()
+            self._flushed = None
+        for post_id in created:
+            trending_posts.record_like(post_id)
+        for post_id, like_age in removed:
+            trending_posts.record_unlike(post_id, like_age)
+        self.written_changes += len(records)
+        self.created_likes += len(created)
+        self.removed_likes += len(removed)
+
+    def start(self) -> None:
+        self._flusher.start()
+
+    async def stop(self) -> None:
+        """ Writes the pending changes, which are lost if this process exits before they are written. """
+        await self._flusher.stop()
+        for attempt in range(1, SHUTDOWN_FLUSH_ATTEMPTS + 1):
+            try:
+                await self.flush()
+                return
+            except Exception:
+                logger.exception('Failed to write pending likes, attempt %s of %s', attempt, SHUTDOWN_FLUSH_ATTEMPTS)
+            if attempt < SHUTDOWN_FLUSH_ATTEMPTS:
+                await asyncio.sleep(attempt)
+        logger.error('Lost %s pending like changes', len(self._changes))
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'recorded_changes': self.recorded_changes,
+            'written_changes': self.written_changes,
+            'created_likes': self.created_likes,
+            'removed_likes': self.removed_likes,
+            'rejected_changes': self.rejected_changes,
+            'skipped_changes': self.skipped_changes,
+            'pending': len(self._changes),
+        }
+
+
+like_buffer = LikeBuffer(
+    LIKE_BUFFER_FLUSH_INTERVAL_MS, LIKE_BUFFER_FLUSH_SIZE, LIKE_BUFFER_MAX_SIZE, LIKE_BUFFER_MAX_WAIT_MS,
+)
+register_stats('like_buffer', like_buffer.stats)
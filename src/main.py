@@ -1,25 +1,79 @@
+import logging
+import time
+
+# Measured from here, since the interpreter itself starts the same way whatever the app imports.
+_imports_started_at = time.perf_counter()
+
 from fastapi import FastAPI
 
-from auth import auth_router
-from db_schema import database
+from auth import auth_router, password_hash_pool
+from background import PeriodicTask
+from db_operations import refresh_post_like_daily
+from db_routing import replica_router
+from db_schema import database, replica_databases
+from instrumentation import instrument_database, timing_middleware
+from last_visit import last_visit_tracker
+from like_buffer import like_buffer
+from metrics import metrics_router
+from monitoring import monitoring_router
+from pool_monitor import pool_monitor
+from response_cache import response_cache
 from routes import router
+from settings import LIKE_BUFFER_ENABLED, POST_LIKE_DAILY_REFRESH_INTERVAL_SECONDS
+from trending import trending_posts
+from warmup import warmup
+
+warmup.import_seconds = time.perf_counter() - _imports_started_at
+logger = logging.getLogger(__name__)
 
 
 app = FastAPI()
+app.middleware('http')(timing_middleware)
+for instrumented_database in (database, *replica_databases):
+    instrument_database(instrumented_database)
+post_like_daily_refresher = PeriodicTask(
+    'post_like_daily_refresh', POST_LIKE_DAILY_REFRESH_INTERVAL_SECONDS, refresh_post_like_daily,
+)
 
 
 @app.on_event('startup')
 async def startup():
     await database.connect()
+    pool_monitor.attach(database)
+    await replica_router.connect()
+    await warmup.run()
+    await trending_posts.start()
+    last_visit_tracker.start()
+    if LIKE_BUFFER_ENABLED:
+        like_buffer.start()
+    post_like_daily_refresher.start()
 
 
 @app.on_event('shutdown')
 async def shutdown():
-    await database.disconnect()
+    # Buffered likes first, since they are lost if they aren't written before the process exits.
+    steps = [like_buffer.stop] if LIKE_BUFFER_ENABLED else []
+    steps += [
+        last_visit_tracker.stop,
+        post_like_daily_refresher.stop,
+        trending_posts.stop,
+        replica_router.disconnect,
+        database.disconnect,
+        response_cache.close,
+    ]
+    # A failed step, e.g. a flush when the database is down, mustn't skip the ones after it.
+    for step in steps:
+        try:
+            await step()
+        except Exception:
+            logger.exception('Shutdown step %s failed', step.__qualname__)
+    password_hash_pool.shutdown()
 
 
 app.include_router(router)
 app.include_router(auth_router)
+app.include_router(monitoring_router)
+app.include_router(metrics_router)
 
 
 if __name__ == '__main__':
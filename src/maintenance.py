@@ -0,0 +1,39 @@
+import argparse
+import asyncio
+
+from db_operations import reconcile_post_like_counts, rebuild_post_like_daily
+from db_schema import DATABASE_URL, create_database
+
+# Maintenance statements run for minutes on large tables, longer than the server's statement timeout.
+database = create_database(DATABASE_URL, command_timeout=None)
+
+
+async def reconcile_like_counts():
+    corrected = await reconcile_post_like_counts(database)
+    print(f'Corrected like count of {corrected} posts')
+
+
+async def backfill_like_rollups():
+    await rebuild_post_like_daily(database)
+    print('Rebuilt post_like_daily')
+
+
+COMMANDS = {
+    'reconcile-like-counts': reconcile_like_counts,
+    'backfill-like-rollups': backfill_like_rollups,
+}
+
+
+async def run_command(command: str):
+    await database.connect()
+    try:
+        await COMMANDS[command]()
+    finally:
+        await database.disconnect()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Database maintenance commands.')
+    parser.add_argument('command', choices=COMMANDS)
+    args = parser.parse_args()
+    asyncio.run(run_command(args.command))
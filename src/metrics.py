@@ -0,0 +1,74 @@
+from typing import Iterator
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from monitoring import collect_stats
+
+metrics_router = APIRouter()
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_histograms: list['Histogram'] = []
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    escaped = (value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for value in values)
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+class Histogram:
+    """ Distribution of observed values, with a separate series for every combination of label values. """
+
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self._description = description
+        self._label_names = label_names
+        self._buckets = tuple(buckets)
+        # Label values -> (count per bucket, sum, count).
+        self._series: dict[tuple[str, ...], tuple[list[int], float, int]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        bucket_counts, total, count = self._series.get(label_values) or ([0] * len(self._buckets), 0.0, 0)
+        for index, upper_bound in enumerate(self._buckets):
+            if value <= upper_bound:
+                bucket_counts[index] += 1
+                break
+        self._series[label_values] = (bucket_counts, total + value, count + 1)
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self._description}'
+        yield f'# TYPE {self.name} histogram'
+        for label_values, (bucket_counts, total, count) in self._series.items():
+            labels = _format_labels(self._label_names, label_values)
+            bucket_labels = f'{labels},' if labels else ''
+            series_labels = f'{{{labels}}}' if labels else ''
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self._buckets, bucket_counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{{{bucket_labels}le="{upper_bound}"}} {cumulative}'
+            yield f'{self.name}_bucket{{{bucket_labels}le="+Inf"}} {count}'
+            yield f'{self.name}_sum{series_labels} {total}'
+            yield f'{self.name}_count{series_labels} {count}'
+
+
+def histogram(name: str, description: str, label_names: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    """ Creates a histogram exported at /metrics. """
+    new_histogram = Histogram(name, description, label_names, buckets)
+    _histograms.append(new_histogram)
+    return new_histogram
+
+
+def _render_stats() -> Iterator[str]:
+    """ Numeric values from /monitoring/stats/ as gauges named <provider>_<key>. """
+    for provider_name, stats in collect_stats().items():
+        for key, value in stats.items():
+            if isinstance(value, (int, float)):
+                name = f'{provider_name}_{key}'
+                yield f'# TYPE {name} gauge'
+                yield f'{name} {float(value)}'
+
+
+@metrics_router.get('/metrics', response_class=PlainTextResponse)
+async def get_metrics():
+    lines = [line for metric in _histograms for line in metric.render()]
+    lines.extend(_render_stats())
+    return PlainTextResponse('\n'.join(lines) + '\n', media_type='text/plain; version=0.0.4')
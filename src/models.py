@@ -2,7 +2,10 @@ from datetime import datetime
 from enum import Enum
 from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, conint, conlist
+
+from db_schema import MAX_ID
+from settings import MAX_LIKE_BATCH_SIZE, MAX_POST_BATCH_SIZE
 
 
 class User(BaseModel):
@@ -16,6 +19,11 @@ class UserAuth(User):
     password_hash: str
 
 
+class UserPage(BaseModel):
+    users: list[User]
+    next_cursor: Optional[str]
+
+
 class UserCreate(BaseModel):
     username: str
     password: str
@@ -34,18 +42,62 @@ class Post(BaseModel):
     like_count: int = 0
 
 
+class TrendingPost(Post):
+    score: float
+
+
+class PostPage(BaseModel):
+    posts: list[Post]
+    next_cursor: Optional[str]
+
+
 class PostCreate(BaseModel):
     title: str
     body: str
 
 
+class PostBatch(BaseModel):
+    posts: conlist(PostCreate, min_items=1, max_items=MAX_POST_BATCH_SIZE)
+
+
+class PostBatchItemStatus(str, Enum):
+    CREATED = 'created'
+    DUPLICATE_TITLE = 'duplicate_title'
+
+
+class PostBatchItemResult(BaseModel):
+    id: Optional[int]
+    status: PostBatchItemStatus
+
+
 class Like(BaseModel):
     user_id: int
     post_id: int
     datetime: datetime
 
 
+class LikeBatch(BaseModel):
+    post_ids: conlist(conint(ge=1, le=MAX_ID), min_items=1, max_items=MAX_LIKE_BATCH_SIZE)
+
+
+class LikeBatchResult(BaseModel):
+    created: list[int]
+    already_liked: list[int]
+    not_found: list[int]
+
+
+class UnlikeBatchResult(BaseModel):
+    removed: list[int]
+    # Including posts that don't exist.
+    not_liked: list[int]
+
+
 class RowCreationResult(Enum):
     CREATED = 1
     UNIQUE_VIOLATION = 2
     FOREIGN_KEY_VIOLATION = 3
+
+
+class LikeStatsFormat(str, Enum):
+    NESTED = 'nested'
+    COLUMNAR = 'columnar'
@@ -0,0 +1,20 @@
+from typing import Callable
+
+from fastapi import APIRouter
+
+monitoring_router = APIRouter(prefix='/monitoring')
+_stats_providers: dict[str, Callable[[], dict]] = {}
+
+
+def register_stats(name: str, provider: Callable[[], dict]) -> None:
+    """ Makes provider() output part of the /monitoring/stats/ response under the given name. """
+    _stats_providers[name] = provider
+
+
+def collect_stats() -> dict[str, dict]:
+    return {name: provider() for name, provider in _stats_providers.items()}
+
+
+@monitoring_router.get('/stats/')
+async def get_stats():
+    return collect_stats()
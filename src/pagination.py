@@ -0,0 +1,40 @@
+import base64
+import json
+from typing import Any
+
+from fastapi import HTTPException, status
+
+from db_schema import MAX_ID
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(*values: Any) -> str:
+    """ Packs keyset values of the last returned row into an opaque cursor string. """
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _is_valid(value: Any, value_type: type) -> bool:
+    # Int cursor values are row ids. Clients can edit cursors, and ids that don't fit an INTEGER column
+    # would fail the query. JSON true and false are bools, which are ints in python.
+    if value_type is int:
+        return type(value) is int and 1 <= value <= MAX_ID
+    return isinstance(value, value_type)
+
+
+def decode_cursor(cursor: str, *types: type) -> tuple:
+    """ Unpacks a cursor made by encode_cursor, raising 400 if its values don't match the expected types. """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        values = None
+    if (
+            not isinstance(values, list)
+            or len(values) != len(types)
+            or not all(_is_valid(value, value_type) for value, value_type in zip(values, types))
+    ):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+    return tuple(values)
@@ -0,0 +1,96 @@
+import logging
+import time
+
+import asyncpg
+import databases
+
+from monitoring import register_stats
+
+logger = logging.getLogger(__name__)
+
+
+class _MonitoredPool:
+    """ Proxy for asyncpg pool measuring how long acquire() waits for a connection. """
+
+    def __init__(self, pool: asyncpg.pool.Pool, monitor: 'PoolMonitor'):
+        self._pool = pool
+        self._monitor = monitor
+
+    async def acquire(self, *, timeout=None):
+        self._monitor.waiting += 1
+        start = time.perf_counter()
+        try:
+            connection = await self._pool.acquire(timeout=timeout)
+        except Exception:
+            self._monitor.failed_acquires += 1
+            raise
+        finally:
+            self._monitor.waiting -= 1
+        self._monitor.record_acquire(time.perf_counter() - start)
+        return connection
+
+    async def release(self, connection, *, timeout=None):
+        self._monitor.in_use -= 1
+        return await self._pool.release(connection, timeout=timeout)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+class PoolMonitor:
+    """
+    Connection pool usage of the database: connections in use, requests waiting for one
+    and time spent waiting, which grows once the pool size becomes the bottleneck.
+    """
+
+    def __init__(self):
+        self._pool = None
+        self.in_use = 0
+        self.waiting = 0
+        self.acquires = 0
+        self.failed_acquires = 0
+        self.acquire_seconds_total = 0.0
+        self.acquire_seconds_max = 0.0
+
+    def attach(self, database: databases.Database) -> None:
+        """
+        Starts measuring the pool of the database, must be called after it's connected.
+
+        databases has no hook for this, so the asyncpg pool its postgres backend keeps in _pool is wrapped,
+        which works with the databases 0.4.x versions pyproject.toml allows. Any other backend, or a version
+        keeping the pool elsewhere, is left unmeasured.
+        """
+        pool = getattr(database._backend, '_pool', None)
+        if not isinstance(pool, asyncpg.pool.Pool):
+            logger.warning('Connection pool of %s is not measured, no asyncpg pool found', type(database._backend))
+            return
+        self._pool = pool
+        database._backend._pool = _MonitoredPool(pool, self)
+
+    def record_acquire(self, seconds: float) -> None:
+        self.in_use += 1
+        self.acquires += 1
+        self.acquire_seconds_total += seconds
+        self.acquire_seconds_max = max(self.acquire_seconds_max, seconds)
+
+    def stats(self) -> dict:
+        stats = {
+            'in_use': self.in_use,
+            'waiting': self.waiting,
+            'acquires': self.acquires,
+            'failed_acquires': self.failed_acquires,
+            'acquire_ms_avg': round(self.acquire_seconds_total / self.acquires * 1000, 3) if self.acquires else 0,
+            'acquire_ms_max': round(self.acquire_seconds_max * 1000, 3),
+        }
+        if self._pool is not None:
+            stats.update(
+                size=self._pool.get_size(),
+                idle=self._pool.get_idle_size(),
+                min_size=self._pool.get_min_size(),
+                max_size=self._pool.get_max_size(),
+            )
+        return stats
+
+
+pool_monitor = PoolMonitor()
+register_stats('db_pool', pool_monitor.stats)
@@ -0,0 +1,53 @@
+import time
+from typing import Any, Optional
+
+import asyncpg
+import databases
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import ClauseElement
+
+from instrumentation import record_query
+
+
+class PreparedQuery:
+    """
+    SQLAlchemy query compiled to SQL once, when it's defined, and run on the raw asyncpg connection.
+
+    asyncpg keeps the statement prepared in each connection's statement cache, so it's only parsed and planned
+    by postgres once per connection, while databases would compile the query again on every call.
+    Parameters are given with sqlalchemy.bindparam() and passed to fetch methods as keyword arguments.
+    """
+
+    _dialect = postgresql.dialect(paramstyle='pyformat')
+
+    def __init__(self, query: ClauseElement):
+        compiled = query.compile(dialect=self._dialect)
+        # Values of literals embedded in the query, bindparam() ones are None.
+        self._default_values = compiled.params
+        self._param_names = list(compiled.params)
+        placeholders = {name: f'${position}' for position, name in enumerate(self._param_names, start=1)}
+        self.sql: str = compiled.string % placeholders
+
+    def _get_args(self, values: dict[str, Any]) -> list:
+        values = {**self._default_values, **values}
+        return [values[name] for name in self._param_names]
+
+    async def prepare(self, connection: asyncpg.Connection, **values) -> None:
+        """ Runs the query once on the raw connection, so it's already prepared there for the first request. """
+        await connection.fetch(self.sql, *self._get_args(values))
+
+    async def fetch_all(self, database: databases.Database, **values) -> list[asyncpg.Record]:
+        async with database.connection() as connection:
+            started_at = time.perf_counter()
+            try:
+                return await connection.raw_connection.fetch(self.sql, *self._get_args(values))
+            finally:
+                record_query(self.sql, time.perf_counter() - started_at)
+
+    async def fetch_one(self, database: databases.Database, **values) -> Optional[asyncpg.Record]:
+        async with database.connection() as connection:
+            started_at = time.perf_counter()
+            try:
+                return await connection.raw_connection.fetchrow(self.sql, *self._get_args(values))
+            finally:
+                record_query(self.sql, time.perf_counter() - started_at)
@@ -1,21 +1,47 @@
-from collections import Iterator
-from itertools import cycle
+import random
+from typing import Optional
 
-from random_word import RandomWords
+ONSETS = ('b', 'd', 'f', 'g', 'k', 'l', 'm', 'n', 'p', 'r', 's', 't', 'v', 'z', 'ch', 'sh')
+VOWELS = ('a', 'e', 'i', 'o', 'u', 'ai', 'ea', 'ou')
+SYLLABLES = tuple(onset + vowel for onset in ONSETS for vowel in VOWELS)
 
 
-class RandomWordCycle:
+class WordGenerator:
+    """
+    Offline, seeded source of pronounceable pseudo-words.
 
-    def __init__(self, word_pool_size: int = 500):
-        random_words = RandomWords()
-        random_word_list = []
-        while not random_word_list:
-            # Sometimes get_random_words() returns None. We'll try until it's not empty.
-            random_word_list = random_words.get_random_words(limit=word_pool_size)
-        self._word_cycle: Iterator[str] = cycle(random_word_list)
+    Iterating yields random words that may repeat, which is fine for post bodies and passwords.
+    unique_word() never returns the same word twice for one generator: it walks a counter through
+    a seeded permutation of all UNIQUE_WORD_SYLLABLES-syllable words, so it's cheap for millions of words.
+    """
+
+    MIN_SYLLABLES = 1
+    MAX_SYLLABLES = 4
+    UNIQUE_WORD_SYLLABLES = 5
+
+    def __init__(self, seed: Optional[int] = None):
+        self._random = random.Random(seed)
+        self._unique_word_space = len(SYLLABLES) ** self.UNIQUE_WORD_SYLLABLES
+        # The space size is a power of two, so any odd multiplier makes index -> (index * a + b) % size a bijection.
+        self._permutation_multiplier = self._random.randrange(1, self._unique_word_space, 2)
+        self._permutation_offset = self._random.randrange(self._unique_word_space)
+        self._unique_word_count = 0
 
     def __iter__(self):
         return self
 
-    def __next__(self):
-        return next(self._word_cycle)
+    def __next__(self) -> str:
+        number_of_syllables = self._random.randint(self.MIN_SYLLABLES, self.MAX_SYLLABLES)
+        return ''.join(self._random.choices(SYLLABLES, k=number_of_syllables))
+
+    def unique_word(self) -> str:
+        if self._unique_word_count >= self._unique_word_space:
+            raise RuntimeError('All unique words are used up')
+        index = self._unique_word_count * self._permutation_multiplier + self._permutation_offset
+        index %= self._unique_word_space
+        self._unique_word_count += 1
+        syllables = []
+        for _ in range(self.UNIQUE_WORD_SYLLABLES):
+            index, syllable_index = divmod(index, len(SYLLABLES))
+            syllables.append(SYLLABLES[syllable_index])
+        return ''.join(syllables)
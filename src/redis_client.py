@@ -0,0 +1,104 @@
+import asyncio
+from typing import Any, Optional, Union
+from urllib.parse import urlparse
+
+
+class RedisError(Exception):
+    pass
+
+
+def _encode_command(args: tuple) -> bytes:
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(parts)
+
+
+async def _read_reply(reader: asyncio.StreamReader) -> Any:
+    line = await reader.readuntil(b'\r\n')
+    kind, payload = line[:1], line[1:-2]
+    if kind == b'+':
+        return payload.decode()
+    if kind == b'-':
+        raise RedisError(payload.decode())
+    if kind == b':':
+        return int(payload)
+    if kind == b'$':
+        length = int(payload)
+        if length == -1:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if kind == b'*':
+        length = int(payload)
+        if length == -1:
+            return None
+        return [await _read_reply(reader) for _ in range(length)]
+    raise RedisError(f'Unexpected reply: {line!r}')
+
+
+async def _roundtrip(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, args: tuple) -> Any:
+    writer.write(_encode_command(args))
+    await writer.drain()
+    return await _read_reply(reader)
+
+
+class RedisClient:
+    """
+    Minimal client for servers speaking the Redis protocol (RESP), enough for caching.
+
+    Commands are sent one at a time over a single connection, which is opened lazily and reopened
+    after any error, so a restarted server is picked up without restarting the app.
+    """
+
+    def __init__(self, url: str, timeout: float):
+        parsed = urlparse(url)
+        self._host = parsed.hostname or 'localhost'
+        self._port = parsed.port or 6379
+        self._password = parsed.password
+        self._db = int(parsed.path.lstrip('/') or 0)
+        self._timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        # Created by the first command, in the server's event loop, see PeriodicTask.
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def _connect(self) -> None:
+        reader, writer = await asyncio.open_connection(self._host, self._port)
+        try:
+            if self._password:
+                await _roundtrip(reader, writer, ('AUTH', self._password))
+            if self._db:
+                await _roundtrip(reader, writer, ('SELECT', self._db))
+        except BaseException:
+            # Including cancellation by the timeout, a connection that isn't set up is never kept.
+            writer.close()
+            raise
+        self._reader, self._writer = reader, writer
+
+    async def _execute(self, args: tuple) -> Any:
+        if self._writer is None:
+            await self._connect()
+        return await _roundtrip(self._reader, self._writer, args)
+
+    async def command(self, *args: Union[str, int, bytes]) -> Any:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            try:
+                return await asyncio.wait_for(self._execute(args), self._timeout)
+            except RedisError as e:
+                # Replies to commands that were sent are still in order, unless it's a protocol error.
+                if str(e).startswith('Unexpected reply'):
+                    self.close()
+                raise
+            except (OSError, EOFError, asyncio.TimeoutError):
+                # The reply may be half read, so the connection can't be reused.
+                self.close()
+                raise
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+import orjson
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+
+from cache import TTLCache
+from monitoring import register_stats
+from redis_client import RedisClient, RedisError
+from settings import RESPONSE_CACHE_URL, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Namespaces group cached responses invalidated by the same writes.
+POSTS = 'posts'
+USERS = 'users'
+_BACKEND_ERRORS = (OSError, EOFError, asyncio.TimeoutError, RedisError)
+
+
+class MemoryBackend:
+    """ Cache local to the process. With several server processes, each one only sees its own invalidations. """
+
+    def __init__(self, maxsize: int):
+        self._entries = TTLCache(maxsize=maxsize, ttl=0)
+        # Kept apart from the entries so they're never evicted; an evicted counter would bring old entries back.
+        self._counters: dict[str, int] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._entries.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._entries.set(key, value, ttl=ttl)
+
+    async def get_counter(self, key: str) -> int:
+        return self._counters.get(key, 0)
+
+    async def incr(self, key: str) -> None:
+        self._counters[key] = self._counters.get(key, 0) + 1
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> dict[str, int]:
+        stats = self._entries.stats()
+        return {'size': stats['size'], 'maxsize': stats['maxsize']}
+
+
+class RedisBackend:
+    """ Cache shared by all server processes, stored in a Redis-protocol server. """
+
+    def __init__(self, url: str, timeout: float):
+        self._client = RedisClient(url, timeout)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._client.command('GET', key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self._client.command('SET', key, value, 'PX', int(ttl * 1000))
+
+    async def get_counter(self, key: str) -> int:
+        return int(await self._client.command('GET', key) or 0)
+
+    async def incr(self, key: str) -> None:
+        await self._client.command('INCR', key)
+
+    async def close(self) -> None:
+        self._client.close()
+
+    def stats(self) -> dict[str, int]:
+        return {}
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or any(tag.replace('W/', '', 1) == etag for tag in tags)
+
+
+class ResponseCache:
+    """
+    Caches serialized JSON responses of public GET endpoints by url, answering with 304 when the client has them.
+
+    Every namespace has a generation counter which is part of the keys; writes bump it, so all cached responses
+    of the namespace are invalidated at once and old entries just expire. Changes that don't invalidate
+    the cache, like last_visit of users, show up after at most ttl seconds. Backend errors are logged
+    and treated as misses, so the endpoints keep working without the cache.
+    """
+
+    def __init__(self, backend, ttl: float):
+        self._backend = backend
+        self._ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.errors = 0
+
+    async def _get_key(self, namespace: str, request: Request) -> str:
+        generation = await self._backend.get_counter(f'generation:{namespace}')
+        return f'response:{namespace}:{generation}:{request.url.path}?{request.url.query}'
+
+    async def respond(
+            self,
+            request: Request,
+            namespace: str,
+            response_model: Any,
+            get_content: Callable[[], Awaitable[Any]],
+    ) -> Response:
+        """
+        Returns the cached response for the request url, calling get_content to make it on a miss.
+
+        With response_model=None, get_content must return the JSON body itself, already serialized.
+        """
+        key = entry = None
+        try:
+            key = await self._get_key(namespace, request)
+            entry = await self._backend.get(key)
+        except _BACKEND_ERRORS as e:
+            self.errors += 1
+            logger.warning('Response cache is unavailable: %r', e)
+
+        if entry is None:
+            self.misses += 1
+            content = await get_content()
+            if response_model is None:
+                body = content
+            else:
+                # Validating plain data, as FastAPI does, drops fields that aren't in the response model.
+                content = parse_obj_as(response_model, jsonable_encoder(content))
+                # Encoded like the orjson fast path of the routes (raw UTF-8), so both give the same body and ETag.
+                body = orjson.dumps(jsonable_encoder(content))
+            etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+            if key is not None and self._ttl > 0:
+                try:
+                    await self._backend.set(key, etag.encode() + b'\n' + body, self._ttl)
+                except _BACKEND_ERRORS as e:
+                    self.errors += 1
+                    logger.warning('Response cache is unavailable: %r', e)
+        else:
+            self.hits += 1
+            etag, body = entry.split(b'\n', 1)
+            etag = etag.decode()
+
+        # no-cache lets clients store the response but makes them revalidate it with If-None-Match every time.
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if _etag_matches(request.headers.get('if-none-match'), etag):
+            self.not_modified += 1
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(body, media_type='application/json', headers=headers)
+
+    async def invalidate(self, namespace: str) -> None:
+        try:
+            await self._backend.incr(f'generation:{namespace}')
+        except _BACKEND_ERRORS as e:
+            self.errors += 1
+            logger.warning('Failed to invalidate %s responses, they may be stale for up to %s seconds: %r',
+                           namespace, self._ttl, e)
+
+    async def close(self) -> None:
+        await self._backend.close()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+            'errors': self.errors,
+            **self._backend.stats(),
+        }
+
+
+if RESPONSE_CACHE_URL:
+    _backend = RedisBackend(RESPONSE_CACHE_URL, RESPONSE_CACHE_TIMEOUT_SECONDS)
+else:
+    _backend = MemoryBackend(RESPONSE_CACHE_SIZE)
+response_cache = ResponseCache(_backend, RESPONSE_CACHE_TTL_SECONDS)
+register_stats('response_cache', response_cache.stats)
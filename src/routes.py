@@ -1,13 +1,25 @@
 from datetime import date
+from typing import AsyncIterator, Awaitable, Callable, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
 
 from auth import get_current_user, create_user
-from db_operations import insert_post, select_posts, create_like, delete_like, get_post_like_count, get_post_like_stats, \
-    fetch_user, fetch_users
-from models import Post, User, RowCreationResult, PostCreate, UserCreate
+from db_operations import insert_post, insert_posts, select_posts, create_like, create_likes, delete_like, \
+    get_post_like_stats, fetch_user, fetch_public_user, fetch_users, iterate_posts, get_post_like_stats_columnar, \
+    select_liked_posts, select_post_dicts, fetch_user_dicts, search_posts, delete_likes
+from db_schema import MAX_ID
+from like_buffer import LikeBufferFullError, like_buffer
+from models import Post, User, UserPage, RowCreationResult, PostCreate, UserCreate, PostPage, LikeStatsFormat, \
+    LikeBatch, LikeBatchResult, UnlikeBatchResult, PostBatch, PostBatchItemResult, PostBatchItemStatus, TrendingPost
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, decode_cursor
+from response_cache import POSTS, USERS, response_cache
+import settings
+from trending import trending_posts
 
 router = APIRouter(prefix='/api')
+MAX_SEARCH_QUERY_LENGTH = 200
 RESERVED_USERNAMES = (
     'me',
 )
@@ -23,9 +35,30 @@ async def signup(user: UserCreate):
     return {'username': user.username}
 
 
-@router.get('/users/', response_model=list[User])
-async def get_users():
-    return await fetch_users()
+@router.get('/users/', response_model=UserPage)
+async def get_users(
+        request: Request,
+        prefix: Optional[str] = Query(None, min_length=1),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[str] = None,
+):
+    # Users are paged by id, or by username when searching by prefix, e.g. to autocomplete usernames.
+    key_field = 'id' if prefix is None else 'username'
+    after_key = decode_cursor(after, int if prefix is None else str)[0] if after else None
+
+    async def get_page_json() -> bytes:
+        users = await fetch_user_dicts(prefix=prefix, after=after_key, limit=limit + 1)
+        next_cursor = encode_cursor(users[limit - 1][key_field]) if len(users) > limit else None
+        return orjson.dumps({'users': users[:limit], 'next_cursor': next_cursor})
+
+    async def get_page() -> UserPage:
+        users = await fetch_users(prefix=prefix, after=after_key, limit=limit + 1)
+        next_cursor = encode_cursor(getattr(users[limit - 1], key_field)) if len(users) > limit else None
+        return UserPage(users=users[:limit], next_cursor=next_cursor)
+
+    if settings.FAST_JSON_RESPONSES:
+        return await response_cache.respond(request, USERS, None, get_page_json)
+    return await response_cache.respond(request, USERS, UserPage, get_page)
 
 
 @router.get('/users/me/', response_model=User)
@@ -34,8 +67,90 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
 
 
 @router.get('/users/{username}', response_model=User)
-async def get_user(username: str):
-    return await fetch_user(username)
+async def get_user(request: Request, username: str):
+    async def get_existing_user():
+        user = await fetch_user(username)
+        if user is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+        return user
+
+    return await response_cache.respond(request, USERS, User, get_existing_user)
+
+
+async def _get_existing_user(username: str) -> User:
+    user = await fetch_public_user(username)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return user
+
+
+def _get_post_page(posts: list[Post], limit: int) -> PostPage:
+    """ Makes a page out of up to limit + 1 posts, the extra one only tells there is a next page. """
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        next_cursor = encode_cursor(posts[-1].id)
+    return PostPage(posts=posts, next_cursor=next_cursor)
+
+
+def _get_post_page_json(posts: list[dict], limit: int) -> bytes:
+    """ Same as _get_post_page for posts from select_post_dicts, serialized to JSON. """
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        next_cursor = encode_cursor(posts[-1]['id'])
+    return orjson.dumps({'posts': posts, 'next_cursor': next_cursor})
+
+
+@router.get('/users/{username}/posts/', response_model=PostPage)
+async def get_user_posts(
+        username: str,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[str] = None,
+):
+    user = await _get_existing_user(username)
+    after_id = decode_cursor(after, int)[0] if after else None
+    posts = await select_posts(author_id=user.id, after_id=after_id, limit=limit + 1)
+    return _get_post_page(posts, limit)
+
+
+@router.get('/users/{username}/likes/', response_model=PostPage)
+async def get_user_liked_posts(
+        username: str,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[str] = None,
+):
+    user = await _get_existing_user(username)
+    after_id = decode_cursor(after, int)[0] if after else None
+    posts = await select_liked_posts(user.id, after_id=after_id, limit=limit + 1)
+    return _get_post_page(posts, limit)
+
+
+@router.get('/posts/trending/', response_model=list[TrendingPost])
+async def get_trending_posts(limit: int = Query(settings.TRENDING_SIZE, ge=1, le=settings.TRENDING_SIZE)):
+    top = trending_posts.top(limit)
+    posts_by_id = {post.id: post for post in await select_posts([post_id for post_id, _ in top])}
+    return [
+        TrendingPost(**posts_by_id[post_id].dict(), score=score)
+        for post_id, score in top
+        if post_id in posts_by_id
+    ]
+
+
+@router.get('/posts/search/', response_model=PostPage)
+async def find_posts(
+        q: str = Query(..., min_length=1, max_length=MAX_SEARCH_QUERY_LENGTH),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[str] = None,
+):
+    after_key = decode_cursor(after, float, int) if after else None
+    results = await search_posts(q, after=after_key, limit=limit + 1)
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        last_post, last_rank = results[-1]
+        next_cursor = encode_cursor(last_rank, last_post.id)
+    return PostPage(posts=[post for post, _ in results], next_cursor=next_cursor)
 
 
 @router.post('/posts/')
@@ -46,45 +161,145 @@ async def create_post(post: PostCreate, current_user: User = Depends(get_current
     return {'id': post_id}
 
 
+@router.post('/posts/batch/', response_model=list[PostBatchItemResult])
+async def create_posts(post_batch: PostBatch, current_user: User = Depends(get_current_user)):
+    post_ids = await insert_posts(current_user.id, [(post.title, post.body) for post in post_batch.posts])
+    return [
+        PostBatchItemResult(
+            id=post_id,
+            status=PostBatchItemStatus.CREATED if post_id is not None else PostBatchItemStatus.DUPLICATE_TITLE,
+        )
+        for post_id in post_ids
+    ]
+
+
 @router.get('/posts/{post_id}/', response_model=Post)
-async def get_post(post_id: int):
-    posts = await select_posts([post_id])
-    if not posts:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-    post = posts[0]
-    post.like_count = await get_post_like_count(post.id)
-    return post
+async def get_post(request: Request, post_id: int):
+    async def get_existing_post():
+        posts = await select_posts([post_id])
+        if not posts:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+        return posts[0]
+
+    return await response_cache.respond(request, POSTS, Post, get_existing_post)
+
+
+async def _posts_as_ndjson(after_id: Optional[int]) -> AsyncIterator[str]:
+    async for post in iterate_posts(after_id):
+        yield post.json() + '\n'
+
+
+@router.get('/posts/', response_model=PostPage)
+async def get_all_posts(
+        request: Request,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[str] = None,
+        stream: bool = False,
+):
+    after_id = decode_cursor(after, int)[0] if after else None
+    if stream:
+        # Streams every post after the cursor, one JSON document per line; limit is ignored.
+        return StreamingResponse(_posts_as_ndjson(after_id), media_type='application/x-ndjson')
+
+    if settings.FAST_JSON_RESPONSES:
+        async def get_page_json():
+            posts = await select_post_dicts(after_id=after_id, limit=limit + 1)
+            return _get_post_page_json(posts, limit)
 
+        return await response_cache.respond(request, POSTS, None, get_page_json)
 
-@router.get('/posts/', response_model=list[Post])
-async def get_all_posts():
-    result = await select_posts()
-    return result
+    async def get_page():
+        posts = await select_posts(after_id=after_id, limit=limit + 1)
+        return _get_post_page(posts, limit)
+
+    return await response_cache.respond(request, POSTS, PostPage, get_page)
+
+
+async def _buffer_like_change(record_change: Callable[[int, int], Awaitable[None]], user_id: int, post_id: int):
+    try:
+        await record_change(user_id, post_id)
+    except LikeBufferFullError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Too many likes in progress, try again later',
+            headers={'Retry-After': '1'},
+        )
 
 
 @router.post('/posts/{post_id}/like/')
-async def like_post(post_id: int, current_user: User = Depends(get_current_user)):
+async def like_post(
+        http_response: Response,
+        post_id: int = Path(..., ge=1, le=MAX_ID),
+        current_user: User = Depends(get_current_user),
+):
+    if settings.LIKE_BUFFER_ENABLED:
+        await _buffer_like_change(like_buffer.like, current_user.id, post_id)
+        http_response.status_code = status.HTTP_202_ACCEPTED
+        return 'Accepted'
     result: RowCreationResult = await create_like(current_user.id, post_id)
     if result == RowCreationResult.FOREIGN_KEY_VIOLATION:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
     elif result == RowCreationResult.UNIQUE_VIOLATION:
         response = 'Already liked'
     elif result == RowCreationResult.CREATED:
+        trending_posts.record_like(post_id)
         response = 'OK'
     else:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
     return response
 
 
+@router.post('/likes/batch/', response_model=LikeBatchResult)
+async def like_posts(like_batch: LikeBatch, current_user: User = Depends(get_current_user)):
+    results = await create_likes(current_user.id, like_batch.post_ids)
+    response = LikeBatchResult(created=[], already_liked=[], not_found=[])
+    for post_id, result in results.items():
+        if result == RowCreationResult.CREATED:
+            trending_posts.record_like(post_id)
+            response.created.append(post_id)
+        elif result == RowCreationResult.UNIQUE_VIOLATION:
+            response.already_liked.append(post_id)
+        else:
+            response.not_found.append(post_id)
+    return response
+
+
+@router.delete('/likes/batch/', response_model=UnlikeBatchResult)
+async def unlike_posts(like_batch: LikeBatch, current_user: User = Depends(get_current_user)):
+    like_ages = await delete_likes(current_user.id, like_batch.post_ids)
+    response = UnlikeBatchResult(removed=[], not_liked=[])
+    for post_id in dict.fromkeys(like_batch.post_ids):
+        if post_id in like_ages:
+            trending_posts.record_unlike(post_id, like_ages[post_id])
+            response.removed.append(post_id)
+        else:
+            response.not_liked.append(post_id)
+    return response
+
+
 @router.delete('/posts/{post_id}/like/')
-async def unlike_post(post_id: int, current_user: User = Depends(get_current_user)):
-    success: bool = await delete_like(current_user.id, post_id)
-    return 'OK' if success else 'Like not found'
+async def unlike_post(
+        http_response: Response,
+        post_id: int = Path(..., ge=1, le=MAX_ID),
+        current_user: User = Depends(get_current_user),
+):
+    if settings.LIKE_BUFFER_ENABLED:
+        await _buffer_like_change(like_buffer.unlike, current_user.id, post_id)
+        http_response.status_code = status.HTTP_202_ACCEPTED
+        return 'Accepted'
+    like_age = await delete_like(current_user.id, post_id)
+    if like_age is None:
+        return 'Like not found'
+    trending_posts.record_unlike(post_id, like_age)
+    return 'OK'
 
 
 @router.get('/analytics/post_likes/')
-async def get_post_like_analytics(date_from: date, date_to: date):
+async def get_post_like_analytics(date_from: date, date_to: date, format: LikeStatsFormat = LikeStatsFormat.NESTED):
     if date_from > date_to:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail='date_from must not be greater than date_to')
+    if format == LikeStatsFormat.COLUMNAR:
+        # Parallel arrays can be large, orjson encodes them without going through jsonable_encoder.
+        return ORJSONResponse(await get_post_like_stats_columnar(date_from, date_to))
     return await get_post_like_stats(date_from, date_to)
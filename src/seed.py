@@ -0,0 +1,160 @@
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
+
+import asyncpg
+
+from auth import pwd_context
+from db_operations import reconcile_post_like_counts, rebuild_post_like_daily
+from db_schema import DATABASE_URL, create_database
+from random_words import WordGenerator
+
+SEED_PASSWORD = 'password'
+MIN_WORDS_IN_POST = 2
+MAX_WORDS_IN_POST = 12
+
+
+class Seeder:
+    """
+    Bulk loads generated users, posts and likes straight into the database with COPY.
+
+    Authors and liked posts are picked with Zipf distributed popularity, and the number of likes per user
+    is exponentially distributed, so the data is skewed like a real social network. All users share one
+    precomputed password hash (password is SEED_PASSWORD).
+    """
+
+    def __init__(
+            self,
+            connection: asyncpg.Connection,
+            *,
+            number_of_users: int,
+            number_of_posts: int,
+            number_of_likes: int,
+            zipf_exponent: float,
+            days: int,
+            batch_size: int,
+            seed: Optional[int] = None,
+    ):
+        self._connection = connection
+        self._number_of_users = number_of_users
+        self._number_of_posts = number_of_posts
+        self._number_of_likes = number_of_likes
+        self._zipf_exponent = zipf_exponent
+        self._days = days
+        self._batch_size = batch_size
+        self._random = random.Random(seed)
+        self._words = WordGenerator(seed)
+
+    def _zipf_cum_weights(self, n: int) -> list[float]:
+        return list(itertools.accumulate(1 / rank ** self._zipf_exponent for rank in range(1, n + 1)))
+
+    def _random_datetime(self, now: datetime) -> datetime:
+        return now - timedelta(seconds=self._random.uniform(0, self._days * 24 * 60 * 60))
+
+    async def _copy(self, table_name: str, columns: list[str], records: Iterator[tuple]) -> int:
+        copied = 0
+        while batch := list(itertools.islice(records, self._batch_size)):
+            await self._connection.copy_records_to_table(table_name, records=batch, columns=columns)
+            copied += len(batch)
+            print(f'{table_name}: {copied} rows copied')
+        return copied
+
+    async def _max_id(self, table_name: str) -> int:
+        return await self._connection.fetchval(f'SELECT coalesce(max(id), 0) FROM {table_name}')
+
+    async def _reset_sequence(self, table_name: str) -> None:
+        await self._connection.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table_name}', 'id'), max(id)) FROM {table_name}"
+        )
+
+    def _generate_users(self, first_user_id: int) -> Iterator[tuple]:
+        password_hash = pwd_context.hash(SEED_PASSWORD)
+        for user_id in range(first_user_id, first_user_id + self._number_of_users):
+            # The id suffix keeps usernames unique across several seeding runs.
+            yield user_id, f'{self._words.unique_word()}{user_id}', password_hash
+
+    def _generate_posts(self, first_post_id: int, user_ids: range) -> Iterator[tuple]:
+        author_ids = list(user_ids)
+        self._random.shuffle(author_ids)
+        author_cum_weights = self._zipf_cum_weights(len(author_ids))
+        for post_id in range(first_post_id, first_post_id + self._number_of_posts):
+            author_id = self._random.choices(author_ids, cum_weights=author_cum_weights)[0]
+            number_of_words = self._random.randint(MIN_WORDS_IN_POST, MAX_WORDS_IN_POST)
+            body = ' '.join(itertools.islice(self._words, number_of_words))
+            yield post_id, author_id, f'{self._words.unique_word()} {post_id}', body
+
+    def _generate_likes(self, user_ids: range, post_ids: range) -> Iterator[tuple]:
+        ranked_post_ids = list(post_ids)
+        self._random.shuffle(ranked_post_ids)
+        post_cum_weights = self._zipf_cum_weights(len(ranked_post_ids))
+        mean_likes_per_user = self._number_of_likes / len(user_ids)
+        max_likes_per_user = len(ranked_post_ids) // 2
+        now = datetime.now()
+        for user_id in user_ids:
+            number_of_likes = min(max_likes_per_user, round(self._random.expovariate(1 / mean_likes_per_user)))
+            liked_post_ids = set()
+            while len(liked_post_ids) < number_of_likes:
+                liked_post_ids.update(self._random.choices(
+                    ranked_post_ids, cum_weights=post_cum_weights, k=number_of_likes - len(liked_post_ids),
+                ))
+            for post_id in liked_post_ids:
+                yield user_id, post_id, self._random_datetime(now)
+
+    async def run(self) -> None:
+        first_user_id = await self._max_id('app_user') + 1
+        first_post_id = await self._max_id('post') + 1
+        user_ids = range(first_user_id, first_user_id + self._number_of_users)
+        post_ids = range(first_post_id, first_post_id + self._number_of_posts)
+
+        await self._copy('app_user', ['id', 'username', 'password_hash'], self._generate_users(first_user_id))
+        await self._reset_sequence('app_user')
+        await self._copy('post', ['id', 'author_id', 'title', 'body'], self._generate_posts(first_post_id, user_ids))
+        await self._reset_sequence('post')
+        await self._copy('user_like_post', ['user_id', 'post_id', 'datetime'], self._generate_likes(user_ids, post_ids))
+
+
+async def seed_database(args) -> None:
+    started_at = time.perf_counter()
+    connection = await asyncpg.connect(DATABASE_URL)
+    try:
+        seeder = Seeder(
+            connection,
+            number_of_users=args.users,
+            number_of_posts=args.posts,
+            number_of_likes=args.likes,
+            zipf_exponent=args.zipf_exponent,
+            days=args.days,
+            batch_size=args.batch_size,
+            seed=args.seed,
+        )
+        await seeder.run()
+    finally:
+        await connection.close()
+
+    # Reconciling and rebuilding run for minutes on large tables, longer than the server's statement timeout.
+    database = create_database(DATABASE_URL, command_timeout=None)
+    await database.connect()
+    try:
+        print('Updating post like counts')
+        await reconcile_post_like_counts(database)
+        print('Rebuilding daily like rollups')
+        await rebuild_post_like_daily(database)
+    finally:
+        await database.disconnect()
+    print(f'Done in {time.perf_counter() - started_at:.1f} s, every user\'s password is "{SEED_PASSWORD}"')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk load generated users, posts and likes.')
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--posts', type=int, default=1_000_000)
+    parser.add_argument('--likes', type=int, default=10_000_000, help='approximate number of likes')
+    parser.add_argument('--zipf-exponent', type=float, default=1.1, help='skew of post and author popularity')
+    parser.add_argument('--days', type=int, default=365, help='likes are spread over this many past days')
+    parser.add_argument('--batch-size', type=int, default=100_000, help='rows per COPY')
+    parser.add_argument('--seed', type=int, default=None)
+    asyncio.run(seed_database(parser.parse_args()))
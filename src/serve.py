@@ -0,0 +1,12 @@
+"""
+Runs the server with WEB_WORKERS processes, for production; main.py runs a single one.
+
+The app is passed to the workers by name and only they import it: worker processes are spawned and run
+this script again before importing the app, which would build it twice if this script imported it too.
+"""
+import uvicorn
+
+from db_schema import WEB_WORKERS
+
+if __name__ == '__main__':
+    uvicorn.run('main:app', host='0.0.0.0', port=8000, workers=WEB_WORKERS)
@@ -0,0 +1,63 @@
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+
+# Users cached on startup, the authors of the latest posts, see warmup.py.
+WARMUP_USER_CACHE_SIZE = _env_int('WARMUP_USER_CACHE_SIZE', 1000)
+# How long they stay cached, longer than USER_CACHE_TTL_SECONDS so they are still there when their requests come.
+WARMUP_USER_CACHE_TTL_SECONDS = _env_float('WARMUP_USER_CACHE_TTL_SECONDS', 600)
+USER_CACHE_SIZE = _env_int('USER_CACHE_SIZE', 10_000)
+USER_CACHE_TTL_SECONDS = _env_float('USER_CACHE_TTL_SECONDS', 30)
+LAST_VISIT_FLUSH_INTERVAL_MS = _env_int('LAST_VISIT_FLUSH_INTERVAL_MS', 1000)
+PASSWORD_HASH_WORKERS = _env_int('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+PASSWORD_HASH_MAX_PENDING = _env_int('PASSWORD_HASH_MAX_PENDING', 64)
+POST_LIKE_DAILY_REFRESH_INTERVAL_SECONDS = _env_float('POST_LIKE_DAILY_REFRESH_INTERVAL_SECONDS', 300)
+MAX_LIKE_BATCH_SIZE = _env_int('MAX_LIKE_BATCH_SIZE', 1000)
+MAX_POST_BATCH_SIZE = _env_int('MAX_POST_BATCH_SIZE', 1000)
+REPLICA_HEALTH_CHECK_INTERVAL_SECONDS = _env_float('REPLICA_HEALTH_CHECK_INTERVAL_SECONDS', 5)
+REPLICA_HEALTH_CHECK_TIMEOUT_SECONDS = _env_float('REPLICA_HEALTH_CHECK_TIMEOUT_SECONDS', 1)
+# Redis-protocol server url like redis://localhost:6379/0 to share cached responses between processes, in-memory if empty.
+RESPONSE_CACHE_URL = os.environ.get('RESPONSE_CACHE_URL', '')
+RESPONSE_CACHE_SIZE = _env_int('RESPONSE_CACHE_SIZE', 10_000)
+RESPONSE_CACHE_TTL_SECONDS = _env_float('RESPONSE_CACHE_TTL_SECONDS', 5)
+RESPONSE_CACHE_TIMEOUT_SECONDS = _env_float('RESPONSE_CACHE_TIMEOUT_SECONDS', 0.5)
+# Serialize post and user lists from database rows straight to JSON with orjson, without building pydantic models.
+FAST_JSON_RESPONSES = _env_bool('FAST_JSON_RESPONSES', False)
+# HS256 signs tokens with JWT_SECRET_KEY; RS256/ES256 etc. sign with JWT_KEYS_DIR/<JWT_KEY_ID>.pem, see jwt_keys.py.
+JWT_ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')
+# Generate your own secret key and keep it secret for use in production.
+# To get a string like this run:
+# openssl rand -hex 32
+JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'ecf998039f7d180e93bdcda768fc762b51132ebb71287e2dc8fb39230f4d5cfb')
+JWT_KEYS_DIR = os.environ.get('JWT_KEYS_DIR')
+JWT_KEY_ID = os.environ.get('JWT_KEY_ID')
+JWT_CACHE_SIZE = _env_int('JWT_CACHE_SIZE', 100_000)
+JWT_CACHE_TTL_SECONDS = _env_float('JWT_CACHE_TTL_SECONDS', 300)
+# Queries taking at least this long are logged with their SQL, 0 disables the log.
+SLOW_QUERY_THRESHOLD_MS = _env_float('SLOW_QUERY_THRESHOLD_MS', 0)
+# Trending posts: how many are ranked, how fast likes lose weight and how far back they are counted.
+TRENDING_SIZE = _env_int('TRENDING_SIZE', 100)
+TRENDING_HALF_LIFE_HOURS = _env_float('TRENDING_HALF_LIFE_HOURS', 24)
+TRENDING_WINDOW_HOURS = _env_float('TRENDING_WINDOW_HOURS', 7 * 24)
+TRENDING_REBUILD_INTERVAL_SECONDS = _env_float('TRENDING_REBUILD_INTERVAL_SECONDS', 600)
+# Optional write-behind buffer for single likes and unlikes, flushed every interval or once flush size are pending.
+LIKE_BUFFER_ENABLED = _env_bool('LIKE_BUFFER_ENABLED', False)
+LIKE_BUFFER_FLUSH_INTERVAL_MS = _env_int('LIKE_BUFFER_FLUSH_INTERVAL_MS', 200)
+LIKE_BUFFER_FLUSH_SIZE = _env_int('LIKE_BUFFER_FLUSH_SIZE', 5000)
+# Pending likes above which requests wait for a flush, up to max wait, and then get 503.
+LIKE_BUFFER_MAX_SIZE = _env_int('LIKE_BUFFER_MAX_SIZE', 50_000)
+LIKE_BUFFER_MAX_WAIT_MS = _env_int('LIKE_BUFFER_MAX_WAIT_MS', 1000)
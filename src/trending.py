@@ -0,0 +1,128 @@
+import heapq
+import time
+from typing import Optional
+
+from background import PeriodicTask
+from db_operations import select_post_like_scores
+from monitoring import register_stats
+from settings import TRENDING_SIZE, TRENDING_HALF_LIFE_HOURS, TRENDING_WINDOW_HOURS, TRENDING_REBUILD_INTERVAL_SECONDS
+
+
+class TrendingPosts:
+    """
+    Top posts by time-decayed like score: a like weighs 1 when it's made and half as much after every half-life.
+
+    Scores are stored relative to a reference time, so they never need to be decayed: time passing multiplies
+    all of them by the same factor, which keeps their order. Likes and unlikes update scores as they happen,
+    while the best 2 * size posts are kept as candidates, so serving the top only sorts the candidates.
+    Candidates are refilled from all scores when removed likes leave too few of them above the best
+    of the other posts. Scores are rebuilt from the database every rebuild interval, which drops old likes
+    and picks up likes made through other server processes.
+    """
+
+    def __init__(self, size: int, half_life_hours: float, window_hours: float, rebuild_interval: float):
+        self._size = size
+        self._half_life = half_life_hours * 3600
+        self._window = window_hours * 3600
+        self._reference = time.time()
+        self._scores: dict[int, float] = {}
+        self._candidates: set[int] = set()
+        # Upper bound of scores of posts that aren't candidates.
+        self._outside_max = 0.0
+        # Likes and unlikes (post id, like time, +1/-1) recorded while a rebuild is running.
+        self._pending: Optional[list[tuple[int, float, int]]] = None
+        self._rebuilder = PeriodicTask('trending_rebuild', rebuild_interval, self.rebuild)
+        self.rebuilds = 0
+        self.refills = 0
+
+    def _weight(self, like_time: float) -> float:
+        return 2 ** ((like_time - self._reference) / self._half_life)
+
+    def _update(self, post_id: int, like_time: float, sign: int) -> None:
+        score = self._scores.get(post_id, 0.0) + sign * self._weight(like_time)
+        # Unlikes may leave a float rounding error instead of zero.
+        if score <= 1e-9:
+            self._scores.pop(post_id, None)
+            self._candidates.discard(post_id)
+            return
+        self._scores[post_id] = score
+        if post_id in self._candidates:
+            return
+        if len(self._candidates) < 2 * self._size:
+            self._candidates.add(post_id)
+            return
+        weakest = min(self._candidates, key=self._scores.__getitem__)
+        if score > self._scores[weakest]:
+            self._candidates.remove(weakest)
+            self._candidates.add(post_id)
+            score = self._scores[weakest]
+        self._outside_max = max(self._outside_max, score)
+
+    def _record(self, post_id: int, like_time: float, sign: int) -> None:
+        if self._pending is not None:
+            self._pending.append((post_id, like_time, sign))
+        self._update(post_id, like_time, sign)
+
+    def record_like(self, post_id: int) -> None:
+        self._record(post_id, time.time(), 1)
+
+    def record_unlike(self, post_id: int, like_age: float) -> None:
+        """ like_age is how many seconds ago the removed like was made. """
+        # Likes older than the window are not in the scores after a rebuild.
+        if like_age < self._window:
+            self._record(post_id, time.time() - like_age, -1)
+
+    def _refill(self) -> None:
+        best = heapq.nlargest(2 * self._size + 1, self._scores, key=self._scores.__getitem__)
+        self._candidates = set(best[:2 * self._size])
+        self._outside_max = self._scores[best[-1]] if len(best) > 2 * self._size else 0.0
+        self.refills += 1
+
+    def top(self, limit: int) -> list[tuple[int, float]]:
+        """ Returns up to limit best (post id, score) pairs, with scores decayed to the current time. """
+        ranked = sorted(self._candidates, key=self._scores.__getitem__, reverse=True)[:self._size]
+        has_outside_posts = len(self._scores) > len(self._candidates)
+        if has_outside_posts and (len(ranked) < self._size or self._scores[ranked[-1]] < self._outside_max):
+            self._refill()
+            ranked = sorted(self._candidates, key=self._scores.__getitem__, reverse=True)[:self._size]
+        decay = self._weight(time.time())
+        return [(post_id, self._scores[post_id] / decay) for post_id in ranked[:limit]]
+
+    async def rebuild(self) -> None:
+        self._pending = []
+        try:
+            reference = time.time()
+            scores = await select_post_like_scores(self._window, self._half_life)
+            pending = self._pending
+        finally:
+            self._pending = None
+        self._reference = reference
+        self._scores = scores
+        # Candidates must be posts with scores before updating them.
+        self._refill()
+        # Likes recorded during the query may be counted twice, until the next rebuild.
+        for post_id, like_time, sign in pending:
+            self._update(post_id, like_time, sign)
+        self._refill()
+        self.rebuilds += 1
+
+    async def start(self) -> None:
+        await self.rebuild()
+        self._rebuilder.start()
+
+    async def stop(self) -> None:
+        await self._rebuilder.stop()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'posts': len(self._scores),
+            'candidates': len(self._candidates),
+            'rebuilds': self.rebuilds,
+            'refills': self.refills,
+        }
+
+
+trending_posts = TrendingPosts(
+    TRENDING_SIZE, TRENDING_HALF_LIFE_HOURS, TRENDING_WINDOW_HOURS, TRENDING_REBUILD_INTERVAL_SECONDS,
+)
+register_stats('trending_posts', trending_posts.stats)
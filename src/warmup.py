@@ -0,0 +1,86 @@
+import asyncio
+import contextvars
+import logging
+import time
+
+import databases
+
+from db_operations import prepare_hot_queries, preload_user_cache
+from db_schema import database, replica_databases, POOL_MIN_SIZE
+from monitoring import register_stats
+from settings import WARMUP_USER_CACHE_SIZE, WARMUP_USER_CACHE_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """
+    Gets a server process ready for traffic before it starts accepting requests, so the first ones after a restart
+    aren't slower than the rest: every connection the pools open on startup gets the hot queries prepared,
+    which also loads the table metadata into its postgres backend, and the user cache is filled.
+    """
+
+    def __init__(self, user_cache_size: int, user_cache_ttl: float):
+        self._user_cache_size = user_cache_size
+        self._user_cache_ttl = user_cache_ttl
+        self.import_seconds = 0.0
+        self.warmup_seconds = 0.0
+        self.connections = 0
+        self.users = 0
+
+    async def _warm_up_pool(self, pool_database: databases.Database) -> None:
+        acquired = 0
+        all_acquired = asyncio.Event()
+
+        async def warm_up_connection():
+            nonlocal acquired
+            try:
+                async with pool_database.connection() as connection:
+                    acquired += 1
+                    if acquired == POOL_MIN_SIZE:
+                        all_acquired.set()
+                    await prepare_hot_queries(connection.raw_connection)
+                    # Holding the connection until all of them are acquired, so each task warms up a different one.
+                    await all_acquired.wait()
+            finally:
+                # A task that failed will never acquire its connection, so the others stop waiting for it.
+                all_acquired.set()
+
+        # databases keeps the connection of the current task in a context variable, which tasks inherit
+        # from the context they are created in; an empty context makes each task acquire its own connection.
+        results = await asyncio.gather(*(
+            contextvars.Context().run(asyncio.create_task, warm_up_connection()) for _ in range(POOL_MIN_SIZE)
+        ), return_exceptions=True)
+        # Raised once every task has released its connection.
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+        self.connections += POOL_MIN_SIZE
+
+    async def run(self) -> None:
+        """ Must be called after the databases connect, before the server process reports it's ready. """
+        started_at = time.perf_counter()
+        await self._warm_up_pool(database)
+        for replica in replica_databases:
+            # Replicas that are down are skipped, the health check connects to them later.
+            if replica.is_connected:
+                try:
+                    await self._warm_up_pool(replica)
+                except Exception as e:
+                    logger.warning('Failed to warm up replica %s: %r', replica_databases.index(replica), e)
+        if self._user_cache_size:
+            self.users = await preload_user_cache(self._user_cache_size, self._user_cache_ttl)
+        self.warmup_seconds = time.perf_counter() - started_at
+        logger.info('Warmed up in %.2f s after imports in %.2f s', self.warmup_seconds, self.import_seconds)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            'import_seconds': self.import_seconds,
+            'warmup_seconds': self.warmup_seconds,
+            'connections': self.connections,
+            'users': self.users,
+        }
+
+
+warmup = Warmup(WARMUP_USER_CACHE_SIZE, WARMUP_USER_CACHE_TTL_SECONDS)
+register_stats('warmup', warmup.stats)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The server modules import each other by module name, as when running from src.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
@@ -0,0 +1,22 @@
+import asyncio
+
+from background import PeriodicTask
+
+
+def test_task_created_outside_the_event_loop_runs_in_it():
+    calls = []
+
+    async def callback():
+        calls.append(1)
+
+    # Like the module-level tasks, which are created on import, before the server's event loop.
+    task = PeriodicTask('test', 60, callback)
+
+    async def run():
+        task.start()
+        task.run_soon()
+        await asyncio.sleep(0.01)
+        await task.stop()
+
+    asyncio.new_event_loop().run_until_complete(run())
+    assert calls == [1]
@@ -0,0 +1,136 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import db_operations
+from db_routing import ReplicaRouter
+
+
+class StandInConnection:
+    def __init__(self, database: 'StandInDatabase'):
+        self._database = database
+
+    async def fetch(self, query, *args):
+        self._database.queries.append(query)
+        return []
+
+    async def fetchrow(self, query, *args):
+        self._database.queries.append(query)
+        return None
+
+
+class StandInDatabase:
+    """ Records the queries run on it instead of running them, in place of databases.Database. """
+
+    def __init__(self, name: str, *, is_up: bool = True):
+        self.name = name
+        self.is_up = is_up
+        self.is_connected = False
+        self.queries = []
+
+    def _check_up(self):
+        if not self.is_up:
+            raise ConnectionRefusedError(self.name)
+
+    async def connect(self):
+        self._check_up()
+        self.is_connected = True
+
+    async def disconnect(self):
+        self.is_connected = False
+
+    async def fetch_val(self, query, values=None):
+        self._check_up()
+        self.queries.append(query)
+        return 1
+
+    async def fetch_all(self, query, values=None):
+        self.queries.append(query)
+        return []
+
+    async def execute(self, query, values=None):
+        self.queries.append(query)
+
+    @asynccontextmanager
+    async def connection(self):
+        yield type('Connection', (), {'raw_connection': StandInConnection(self)})()
+
+    def __repr__(self):
+        return self.name
+
+
+def create_router(primary, replicas) -> ReplicaRouter:
+    return ReplicaRouter(primary, replicas, health_check_interval=60, health_check_timeout=1)
+
+
+def check_health(router: ReplicaRouter):
+    asyncio.run(router.check_health())
+
+
+def test_reads_go_to_healthy_replicas_in_round_robin():
+    replicas = [StandInDatabase('replica-0'), StandInDatabase('replica-1'), StandInDatabase('replica-2')]
+    router = create_router(StandInDatabase('primary'), replicas)
+    check_health(router)
+    assert [router.get() for _ in range(6)] == replicas + replicas
+    assert router.stats()['replica_reads'] == 6
+
+
+def test_unhealthy_replica_is_skipped_until_it_recovers():
+    replicas = [StandInDatabase('replica-0'), StandInDatabase('replica-1', is_up=False), StandInDatabase('replica-2')]
+    router = create_router(StandInDatabase('primary'), replicas)
+    check_health(router)
+    assert [router.get() for _ in range(4)] == [replicas[0], replicas[2], replicas[0], replicas[2]]
+    assert router.stats()['healthy'] == 2
+
+    replicas[1].is_up = True
+    check_health(router)
+    assert set(router.get() for _ in range(3)) == set(replicas)
+
+
+def test_replica_going_down_is_taken_out_of_rotation():
+    replicas = [StandInDatabase('replica-0'), StandInDatabase('replica-1')]
+    router = create_router(StandInDatabase('primary'), replicas)
+    check_health(router)
+    replicas[0].is_up = False
+    check_health(router)
+    assert [router.get() for _ in range(2)] == [replicas[1], replicas[1]]
+
+
+def test_reads_fall_back_to_primary_when_all_replicas_are_down():
+    primary = StandInDatabase('primary')
+    replicas = [StandInDatabase('replica-0', is_up=False), StandInDatabase('replica-1', is_up=False)]
+    router = create_router(primary, replicas)
+    check_health(router)
+    assert [router.get() for _ in range(2)] == [primary, primary]
+    assert router.stats()['primary_reads'] == 2
+
+
+def test_reads_go_to_primary_without_replicas():
+    primary = StandInDatabase('primary')
+    router = create_router(primary, [])
+    asyncio.run(router.connect())
+    assert router.get() is primary
+
+
+def test_writes_and_reads_after_writes_stay_on_primary(monkeypatch):
+    primary = StandInDatabase('primary')
+    replica = StandInDatabase('replica-0')
+    router = create_router(primary, [replica])
+    check_health(router)
+    replica.queries.clear()
+    monkeypatch.setattr(db_operations, 'database', primary)
+    monkeypatch.setattr(db_operations, 'replica_router', router)
+
+    async def write_and_read_back():
+        await db_operations.insert_post(1, 'title', 'body')
+        await db_operations.create_likes(1, [1])
+        await db_operations.delete_like(1, 1)
+        await db_operations.select_posts([1])
+        await db_operations.fetch_user('user')
+
+    asyncio.run(write_and_read_back())
+    assert len(primary.queries) == 5
+    assert replica.queries == []
+
+    asyncio.run(db_operations.select_posts(limit=10))
+    assert len(replica.queries) == 1
+    assert len(primary.queries) == 5
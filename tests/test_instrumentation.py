@@ -0,0 +1,30 @@
+import logging
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+import instrumentation
+from db_schema import like_daily_table
+
+
+def test_slow_postgres_query_is_logged(monkeypatch, caplog):
+    monkeypatch.setattr(instrumentation, 'SLOW_QUERY_THRESHOLD_MS', 1)
+    query = pg_insert(like_daily_table).values(date='2021-01-01', post_id=1, count=1)
+    query = query.on_conflict_do_update(
+        index_elements=[like_daily_table.c.date, like_daily_table.c.post_id],
+        set_={'count': query.excluded.count},
+    )
+    with caplog.at_level(logging.WARNING, logger='instrumentation'):
+        instrumentation.record_query(query, 0.5)
+    assert 'ON CONFLICT (date, post_id) DO UPDATE' in caplog.text
+
+
+def test_query_that_cannot_be_compiled_is_still_logged(monkeypatch, caplog):
+    monkeypatch.setattr(instrumentation, 'SLOW_QUERY_THRESHOLD_MS', 1)
+
+    class BrokenQuery:
+        def __str__(self):
+            raise ValueError('cannot compile')
+
+    with caplog.at_level(logging.WARNING, logger='instrumentation'):
+        instrumentation.record_query(BrokenQuery(), 0.5)
+    assert 'BrokenQuery' in caplog.text
@@ -0,0 +1,78 @@
+import asyncio
+
+import like_buffer
+from db_schema import MAX_ID
+from like_buffer import LikeBuffer
+
+
+def create_like_buffer() -> LikeBuffer:
+    return LikeBuffer(flush_interval_ms=1000, flush_size=100, max_size=100, max_wait_ms=0)
+
+
+def test_latest_change_per_like_is_written(monkeypatch):
+    written = []
+
+    async def merge_likes(changes):
+        written.extend(changes)
+        return [], []
+
+    monkeypatch.setattr(like_buffer, 'merge_likes', merge_likes)
+    buffer = create_like_buffer()
+
+    async def record_and_flush():
+        await buffer.like(1, 10)
+        await buffer.like(1, 11)
+        await buffer.unlike(1, 10)
+        await buffer.flush()
+
+    asyncio.run(record_and_flush())
+    changes = sorted((user_id, post_id, liked) for user_id, post_id, liked, _ in written)
+    assert changes == [(1, 10, False), (1, 11, True)]
+    assert buffer.stats()['pending'] == 0
+
+
+def test_ids_that_cannot_be_written_are_skipped(monkeypatch):
+    written = []
+
+    async def merge_likes(changes):
+        written.extend(changes)
+        return [], []
+
+    monkeypatch.setattr(like_buffer, 'merge_likes', merge_likes)
+    buffer = create_like_buffer()
+
+    async def record_and_flush():
+        await buffer.like(1, MAX_ID + 1)
+        await buffer.unlike(1, 0)
+        await buffer.like(1, MAX_ID)
+        await buffer.flush()
+
+    asyncio.run(record_and_flush())
+    assert [post_id for _, post_id, _, _ in written] == [MAX_ID]
+    assert buffer.stats()['skipped_changes'] == 2
+
+
+def test_failed_batch_is_retried(monkeypatch):
+    attempts = []
+
+    async def merge_likes(changes):
+        attempts.append(changes)
+        if len(attempts) == 1:
+            raise ConnectionResetError
+        return [], []
+
+    monkeypatch.setattr(like_buffer, 'merge_likes', merge_likes)
+    buffer = create_like_buffer()
+
+    async def record_and_flush():
+        await buffer.like(1, 10)
+        try:
+            await buffer.flush()
+        except ConnectionResetError:
+            pass
+        assert buffer.stats()['pending'] == 1
+        await buffer.flush()
+
+    asyncio.run(record_and_flush())
+    assert len(attempts) == 2
+    assert buffer.stats()['pending'] == 0
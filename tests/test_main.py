@@ -0,0 +1,31 @@
+import asyncio
+
+import main
+
+
+def test_failed_shutdown_step_does_not_skip_the_others(monkeypatch):
+    stopped = []
+
+    def stand_in(name, fails=False):
+        async def stop():
+            stopped.append(name)
+            if fails:
+                raise ConnectionRefusedError
+
+        return stop
+
+    monkeypatch.setattr(main, 'LIKE_BUFFER_ENABLED', True)
+    monkeypatch.setattr(main.like_buffer, 'stop', stand_in('like_buffer'))
+    monkeypatch.setattr(main.last_visit_tracker, 'stop', stand_in('last_visit_tracker', fails=True))
+    monkeypatch.setattr(main.post_like_daily_refresher, 'stop', stand_in('post_like_daily_refresher'))
+    monkeypatch.setattr(main.trending_posts, 'stop', stand_in('trending_posts'))
+    monkeypatch.setattr(main.replica_router, 'disconnect', stand_in('replica_router'))
+    monkeypatch.setattr(main.database, 'disconnect', stand_in('database'))
+    monkeypatch.setattr(main.response_cache, 'close', stand_in('response_cache'))
+    monkeypatch.setattr(main.password_hash_pool, 'shutdown', lambda: stopped.append('password_hash_pool'))
+
+    asyncio.run(main.shutdown())
+    assert stopped == [
+        'like_buffer', 'last_visit_tracker', 'post_like_daily_refresher', 'trending_posts', 'replica_router',
+        'database', 'response_cache', 'password_hash_pool',
+    ]
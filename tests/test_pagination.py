@@ -0,0 +1,24 @@
+import pytest
+from fastapi import HTTPException
+
+from db_schema import MAX_ID
+from pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(0.5, 42), float, int) == (0.5, 42)
+    assert decode_cursor(encode_cursor('alice'), str) == ('alice',)
+
+
+@pytest.mark.parametrize('values', [(True,), (0,), (MAX_ID + 1,), (10 ** 30,), ('1',), (1.0,)])
+def test_invalid_id_cursor_is_rejected(values):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(encode_cursor(*values), int)
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize('cursor', ['', 'not base64!', encode_cursor(1, 2)])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, int)
+    assert error.value.status_code == 400
@@ -0,0 +1,205 @@
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+import orjson
+from starlette.requests import Request
+
+from models import User, UserPage
+from redis_client import RedisClient, RedisError
+from response_cache import POSTS, USERS, MemoryBackend, RedisBackend, ResponseCache
+
+
+class RespServer:
+    """ In-process server speaking enough of the Redis protocol for the response cache: GET, SET, INCR and AUTH. """
+
+    def __init__(self, password: Optional[str] = None):
+        self._password = password
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.data: dict[bytes, bytes] = {}
+        self.connections = 0
+
+    @property
+    def url(self) -> str:
+        port = self._server.sockets[0].getsockname()[1]
+        return f'redis://127.0.0.1:{port}/0'
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        authenticated = self._password is None
+        try:
+            while True:
+                count = int((await reader.readline())[1:])
+                args = []
+                for _ in range(count):
+                    length = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(length + 2))[:-2])
+                command = args[0].upper()
+                if command == b'AUTH':
+                    authenticated = args[1].decode() == self._password
+                    writer.write(b'+OK\r\n' if authenticated else b'-WRONGPASS invalid password\r\n')
+                elif not authenticated:
+                    writer.write(b'-NOAUTH Authentication required\r\n')
+                elif command == b'GET':
+                    value = self.data.get(args[1])
+                    writer.write(b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value))
+                elif command == b'SET':
+                    self.data[args[1]] = args[2]
+                    writer.write(b'+OK\r\n')
+                elif command == b'INCR':
+                    self.data[args[1]] = b'%d' % (int(self.data.get(args[1], 0)) + 1)
+                    writer.write(b':%s\r\n' % self.data[args[1]])
+                else:
+                    writer.write(b'-ERR unknown command\r\n')
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ValueError, ConnectionError):
+            writer.close()
+
+
+def create_request(path: str, query: str = '', if_none_match: Optional[str] = None) -> Request:
+    headers = [(b'host', b'testserver')]
+    if if_none_match is not None:
+        headers.append((b'if-none-match', if_none_match.encode()))
+    return Request({
+        'type': 'http',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'query_string': query.encode(),
+        'headers': headers,
+    })
+
+
+async def run_with_server(test, password: Optional[str] = None):
+    server = RespServer(password)
+    await server.start()
+    try:
+        await test(server)
+    finally:
+        await server.stop()
+
+
+def test_responses_are_cached_and_revalidated():
+    async def test(server: RespServer):
+        cache = ResponseCache(RedisBackend(server.url, timeout=1), ttl=60)
+        calls = []
+
+        async def get_content():
+            calls.append(1)
+            return b'[{"id":1}]'
+
+        first = await cache.respond(create_request('/api/posts/', 'limit=1'), POSTS, None, get_content)
+        second = await cache.respond(create_request('/api/posts/', 'limit=1'), POSTS, None, get_content)
+        assert first.body == second.body == b'[{"id":1}]'
+        assert first.headers['etag'] == second.headers['etag']
+        assert len(calls) == 1
+
+        etag = first.headers['etag']
+        not_modified = await cache.respond(create_request('/api/posts/', 'limit=1', etag), POSTS, None, get_content)
+        assert not_modified.status_code == 304
+        assert not_modified.body == b''
+        weak = await cache.respond(create_request('/api/posts/', 'limit=1', f'"other", W/{etag}'), POSTS, None,
+                                   get_content)
+        assert weak.status_code == 304
+
+        # Another url is a miss, but the same content still matches the ETag the client has.
+        other_url = await cache.respond(create_request('/api/posts/', 'limit=2', etag), POSTS, None, get_content)
+        assert other_url.status_code == 304
+        assert len(calls) == 2
+        assert cache.stats()['hits'] == 3
+        await cache.close()
+
+    asyncio.run(run_with_server(test))
+
+
+def test_invalidation_starts_a_new_generation():
+    async def test(server: RespServer):
+        cache = ResponseCache(RedisBackend(server.url, timeout=1), ttl=60)
+        content = [b'[1]']
+
+        async def get_content():
+            return content[0]
+
+        first = await cache.respond(create_request('/api/posts/'), POSTS, None, get_content)
+        content[0] = b'[1,2]'
+        await cache.invalidate(POSTS)
+        second = await cache.respond(create_request('/api/posts/', if_none_match=first.headers['etag']), POSTS, None,
+                                     get_content)
+        assert second.status_code == 200
+        assert second.body == b'[1,2]'
+        assert second.headers['etag'] != first.headers['etag']
+        assert server.data[b'generation:posts'] == b'1'
+        await cache.close()
+
+    asyncio.run(run_with_server(test))
+
+
+def test_unavailable_backend_is_a_miss():
+    async def test():
+        server = RespServer()
+        await server.start()
+        url = server.url
+        await server.stop()
+        cache = ResponseCache(RedisBackend(url, timeout=1), ttl=60)
+
+        async def get_content():
+            return b'[]'
+
+        response = await cache.respond(create_request('/api/posts/'), POSTS, None, get_content)
+        assert response.status_code == 200
+        assert response.body == b'[]'
+        await cache.invalidate(POSTS)
+        assert cache.stats()['errors'] == 2
+
+    asyncio.run(test())
+
+
+def test_connection_is_not_kept_when_authentication_fails():
+    async def test(server: RespServer):
+        client = RedisClient(server.url.replace('redis://', 'redis://:wrong@'), timeout=1)
+        for _ in range(2):
+            try:
+                await client.command('GET', 'key')
+            except RedisError as e:
+                assert str(e).startswith('WRONGPASS')
+            else:
+                raise AssertionError('AUTH with a wrong password succeeded')
+        # Every command connects and authenticates again, rather than running on the unauthenticated connection.
+        assert server.connections == 2
+
+        client = RedisClient(server.url.replace('redis://', 'redis://:secret@'), timeout=1)
+        assert await client.command('INCR', 'counter') == 1
+        client.close()
+
+    asyncio.run(run_with_server(test, password='secret'))
+
+
+def test_model_and_fast_json_bodies_are_identical():
+    users = [
+        {'id': 1, 'username': 'zoë', 'last_visit': datetime(2021, 1, 2, 3, 4, 5, 6), 'last_login': None},
+        {'id': 2, 'username': '日本', 'last_visit': datetime(2021, 1, 2), 'last_login': datetime(2021, 1, 1)},
+    ]
+    cache = ResponseCache(MemoryBackend(maxsize=10), ttl=0)
+
+    async def respond():
+        async def get_models():
+            return UserPage(users=[User(**user) for user in users], next_cursor=None)
+
+        async def get_json():
+            return orjson.dumps({'users': users, 'next_cursor': None})
+
+        from_models = await cache.respond(create_request('/api/users/'), USERS, UserPage, get_models)
+        from_json = await cache.respond(create_request('/api/users/'), USERS, None, get_json)
+        return from_models, from_json
+
+    from_models, from_json = asyncio.run(respond())
+    assert from_models.body == from_json.body
+    assert from_models.headers['etag'] == from_json.headers['etag']
+    assert 'zoë'.encode() in from_models.body
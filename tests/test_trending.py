@@ -0,0 +1,47 @@
+import asyncio
+
+import trending
+from trending import TrendingPosts
+
+
+def create_trending_posts(size: int) -> TrendingPosts:
+    return TrendingPosts(size, half_life_hours=1, window_hours=24, rebuild_interval=60)
+
+
+def rebuild(trending_posts: TrendingPosts, monkeypatch, scores: dict[int, float], liked_during_rebuild=()):
+    async def select_post_like_scores(window, half_life):
+        for post_id in liked_during_rebuild:
+            trending_posts.record_like(post_id)
+        return dict(scores)
+
+    monkeypatch.setattr(trending, 'select_post_like_scores', select_post_like_scores)
+    asyncio.run(trending_posts.rebuild())
+
+
+def test_top_ranks_posts_by_score(monkeypatch):
+    trending_posts = create_trending_posts(2)
+    rebuild(trending_posts, monkeypatch, {1: 1.0, 2: 3.0, 3: 2.0})
+    assert [post_id for post_id, _ in trending_posts.top(10)] == [2, 3]
+
+
+def test_likes_update_top(monkeypatch):
+    trending_posts = create_trending_posts(1)
+    rebuild(trending_posts, monkeypatch, {1: 1.0, 2: 1.5, 3: 0.5})
+    trending_posts.record_like(3)
+    assert [post_id for post_id, _ in trending_posts.top(1)] == [3]
+
+
+def test_unlikes_refill_candidates(monkeypatch):
+    trending_posts = create_trending_posts(1)
+    rebuild(trending_posts, monkeypatch, {1: 3.0, 2: 2.5, 3: 2.0})
+    trending_posts.record_unlike(1, 0)
+    trending_posts.record_unlike(2, 0)
+    assert [post_id for post_id, _ in trending_posts.top(1)] == [3]
+
+
+def test_rebuild_replaces_candidates_before_replaying_pending_likes(monkeypatch):
+    trending_posts = create_trending_posts(1)
+    rebuild(trending_posts, monkeypatch, {1: 1.0, 2: 2.0, 3: 3.0})
+    rebuild(trending_posts, monkeypatch, {9: 0.5}, liked_during_rebuild=[5])
+    assert [post_id for post_id, _ in trending_posts.top(10)] == [5]
+    assert trending_posts.stats()['posts'] == 2
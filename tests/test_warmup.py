@@ -0,0 +1,58 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+import warmup
+from db_schema import POOL_MIN_SIZE
+from warmup import Warmup
+
+
+class StandInPool:
+    """ In place of databases.Database, counting connections held at the same time. """
+
+    def __init__(self, failed_acquires: int = 0):
+        self.failed_acquires = failed_acquires
+        self.in_use = 0
+        self.max_in_use = 0
+
+    @asynccontextmanager
+    async def connection(self):
+        await asyncio.sleep(0)
+        if self.failed_acquires:
+            self.failed_acquires -= 1
+            raise ConnectionRefusedError
+        self.in_use += 1
+        self.max_in_use = max(self.max_in_use, self.in_use)
+        try:
+            yield type('Connection', (), {'raw_connection': object()})()
+        finally:
+            self.in_use -= 1
+
+
+def test_every_connection_is_warmed_up(monkeypatch):
+    prepared = []
+
+    async def prepare_hot_queries(connection):
+        prepared.append(connection)
+
+    monkeypatch.setattr(warmup, 'prepare_hot_queries', prepare_hot_queries)
+    pool = StandInPool()
+    asyncio.run(Warmup(0, 0)._warm_up_pool(pool))
+    assert len(prepared) == pool.max_in_use == POOL_MIN_SIZE
+    assert pool.in_use == 0
+
+
+def test_failed_connection_releases_the_others(monkeypatch):
+    async def prepare_hot_queries(connection):
+        pass
+
+    monkeypatch.setattr(warmup, 'prepare_hot_queries', prepare_hot_queries)
+    pool = StandInPool(failed_acquires=1)
+
+    async def warm_up():
+        with pytest.raises(ConnectionRefusedError):
+            await asyncio.wait_for(Warmup(0, 0)._warm_up_pool(pool), 5)
+        assert pool.in_use == 0
+
+    asyncio.run(warm_up())